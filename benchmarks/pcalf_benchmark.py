@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark of the core search pipeline on synthetic proteomes.
+
+Synthetic proteomes are made of random background proteins and of calcyanins
+sampled from pcalf/datas/calcyanin.fasta with point mutations. Each stage is
+timed and its throughput and peak RSS are saved as JSON, e.g :
+
+    python benchmarks/pcalf_benchmark.py -o bench.json --genomes 8 --proteome-size 2000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import random
+import shutil
+import logging
+import platform
+import tempfile
+import contextlib
+import multiprocessing
+from importlib import resources, metadata
+
+import pyhmmer
+
+import pcalf.datas as datas
+from pcalf.core import search, bioseq, profiling
+
+
+DATASDIR = os.path.join(resources.files(datas))
+
+# Background amino acid frequencies (UniProtKB/Swiss-Prot).
+BACKGROUND = {
+    "A":8.25,"R":5.53,"N":4.06,"D":5.45,"C":1.37,"Q":3.93,"E":6.75,"G":7.07,"H":2.27,"I":5.96,
+    "L":9.66,"K":5.84,"M":2.42,"F":3.86,"P":4.70,"S":6.56,"T":5.34,"W":1.08,"Y":2.92,"V":6.87,
+}
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="""
+    pcalf benchmark
+    Time the core search pipeline on synthetic proteomes and save results as JSON.
+    """,
+        formatter_class= argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('-o','--output', default="pcalf-benchmark.json",
+                        help="JSON file where results are saved (default: %(default)s).")
+    parser.add_argument('--genomes', type=int, default=4,
+                        help="Number of synthetic proteomes (default: %(default)s).")
+    parser.add_argument('--proteome-size', dest='proteome_size', type=int, default=2000,
+                        help="Number of proteins per proteome (default: %(default)s).")
+    parser.add_argument('--calcyanin-density', dest='calcyanin_density', type=float, default=0.002,
+                        help="Fraction of proteins sampled from known calcyanins (default: %(default)s).")
+    parser.add_argument('--mutation-rate', dest='mutation_rate', type=float, default=0.05,
+                        help="Fraction of residues mutated in sampled calcyanins (default: %(default)s).")
+    parser.add_argument('--seed', type=int, default=42,
+                        help="Random seed, same seed same proteomes (default: %(default)s).")
+    parser.add_argument('--max-iteration', dest='max_iteration', type=int, default=2,
+                        help="Max iteration of the run_pcalf stage (default: %(default)s).")
+    parser.add_argument('--threads', type=int, default=multiprocessing.cpu_count(),
+                        help="(default: %(default)s)")
+    parser.add_argument('--nter-method', dest='nter_method', choices=["blastp","phmmer"], default="blastp",
+                        help="N-ter search method of the run_pcalf stage (default: %(default)s).")
+    parser.add_argument('--workdir', default=None,
+                        help="Directory of synthetic proteomes and outputs, kept if set (default: temporary directory).")
+    parser.add_argument('--debug', action="store_true")
+    return parser.parse_args()
+
+
+def synthetic_proteomes(workdir, genomes, proteome_size, calcyanin_density, mutation_rate, seed):
+    """Write synthetic proteomes as fasta files.
+
+    Args:
+        workdir (str): Output directory.
+        genomes (int): Number of proteomes.
+        proteome_size (int): Number of proteins per proteome.
+        calcyanin_density (float): Fraction of proteins sampled from known calcyanins.
+        mutation_rate (float): Fraction of residues mutated in sampled calcyanins.
+        seed (int): Random seed.
+    Raises:
+        None
+    Return:
+        A tuple (fastas, names, number of calcyanins).
+    """
+    rng = random.Random(seed)
+    residues, weights = list(BACKGROUND), list(BACKGROUND.values())
+    calcyanins = [str(s.seq) for s in bioseq.Sequences(os.path.join(DATASDIR,"calcyanin.fasta")).sequences]
+    fastas, names, n_calcyanins = [], [], 0
+    for g in range(genomes):
+        name = "genome{}".format(g)
+        fasta = os.path.join(workdir,"{}.faa".format(name))
+        with open(fasta,"w") as fh:
+            for p in range(proteome_size):
+                if rng.random() < calcyanin_density:
+                    seq = [aa if rng.random() >= mutation_rate else rng.choices(residues,weights)[0]
+                           for aa in rng.choice(calcyanins)]
+                    n_calcyanins += 1
+                else:
+                    seq = rng.choices(residues,weights,k=int(rng.lognormvariate(5.6,0.5)) + 30)
+                fh.write(">{}_{}\n{}\n".format(name,p,"".join(seq)))
+        fastas.append(fasta)
+        names.append(name)
+    return fastas, names, n_calcyanins
+
+
+def rss_mb():
+    """Current resident set size in MB."""
+    with open("/proc/self/statm") as fh:
+        return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024**2
+
+
+@contextlib.contextmanager
+def stage(results, name, n_sequences=0, n_genomes=0):
+    """Time a stage and record its throughput and memory usage in results. \
+    peak_rss_mb is the high water mark of the process during the stage, or since the \
+    process started if peak_rss_scope is "process", see profiling.reset_peak_rss()."""
+    logging.info("Stage {}.".format(name))
+    rss_start = rss_mb() if os.path.exists("/proc/self/statm") else None
+    scope = "stage" if profiling.reset_peak_rss() else "process"
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    results[name] = {
+        "seconds":elapsed,
+        "sequences":n_sequences,
+        "genomes":n_genomes,
+        "sequences_per_s":n_sequences/elapsed if n_sequences and elapsed else None,
+        "genomes_per_s":n_genomes/elapsed if n_genomes and elapsed else None,
+        "rss_start_mb":rss_start,
+        "peak_rss_mb":profiling.peak_rss_mb(),
+        "peak_rss_scope":scope,
+    }
+    logging.info("Stage {} done in {:.2f}s.".format(name,elapsed))
+
+
+def run(args, workdir):
+    results = {}
+    fastas, names, n_calcyanins = synthetic_proteomes(workdir,args.genomes,args.proteome_size,
+                                    args.calcyanin_density,args.mutation_rate,args.seed)
+    n_sequences = args.genomes * args.proteome_size
+    cache_dir = os.path.join(workdir,"cache")
+
+    with stage(results,"load_profiles"):
+        # same profile names as the pcalf script.
+        profiles = [search.load_weighted_hmm(name,os.path.join(DATASDIR,msa),0.2,cache_dir)
+                    for name, msa in [("Glyx3","GlyX3.msa.fa"),("Gly1","Gly1.msa.fa"),
+                                      ("Gly2","Gly2.msa.fa"),("Gly3","Gly3.msa.fa")]]
+    glyx3, gly1, gly2, gly3 = profiles
+    nterdb = search.parse_nterdb(os.path.join(DATASDIR,"nterdb.ref.tsv"))
+    nter_fa = os.path.join(workdir,"nterdb.fa")
+    with open(nter_fa,"w") as fh:
+        for sid, nter in nterdb.items():
+            fh.write(">{}||{}\n{}\n".format(nter[0],sid,nter[1]))
+
+    with stage(results,"parse",n_sequences,args.genomes):
+        proteomes = [bioseq.Sequences(fasta,src=name) for fasta, name in zip(fastas,names)]
+
+    with stage(results,"hmmsearch",n_sequences,args.genomes):
+        for sequences in proteomes:
+            sequences.hmmsearch([p.hmm for p in profiles],cpus=args.threads,Z=10000,domZ=10000)
+
+    candidates = bioseq.Sequences()
+    for sequences in proteomes:
+        sequences.filter_by_hit("Glyx3")
+        candidates.merge(sequences)
+    proteomes = None
+
+    if shutil.which("blastp"):
+        with stage(results,"blastp",len(candidates.sequences)):
+            candidates.blastp(nter_fa,threads=args.threads)
+    else:
+        logging.warning("blastp not found, blastp stage skipped.")
+        results["blastp"] = None
+    with stage(results,"phmmer",len(candidates.sequences)):
+        candidates.phmmer(search.load_nter_targets(nter_fa),cpus=args.threads)
+
+    with stage(results,"hits_2_features",len(candidates.sequences)):
+        search.hits_2_features(candidates,1e-30,0.3,1e-5,0.7,0.8,1e-7)
+
+    calcyanins = [s for s in candidates.sequences if
+                  search.decision_tree(
+                    ",".join(f.qualifiers["src"].split("|")[0] for f in s.features if f.id == "N-ter"),
+                    ",".join(f.id for fid in ("Gly1","Gly2","Gly3") for f in s.features if f.id == fid)
+                  ).startswith("Calcyanin")]
+    valid = bioseq.Sequences()
+    valid.extend(calcyanins)
+    features = valid.get_feature("GlyX3")
+    with stage(results,"update_hmm",len(features)):
+        if features:
+            search.update_hmm(features,glyx3,False)
+
+    with stage(results,"dump_iteration",len(candidates.sequences)):
+        search.dump_iteration(os.path.join(workdir,"dump"),candidates,glyx3,gly1,gly2,gly3,nterdb)
+
+    if args.nter_method == "blastp" and not shutil.which("blastp"):
+        logging.warning("blastp not found, run_pcalf stage skipped.")
+        results["run_pcalf"] = None
+    else:
+        with stage(results,"run_pcalf",n_sequences,args.genomes):
+            search.run_pcalf(fastas,names,glyx3,gly1,gly2,gly3,nterdb,
+                Z=10000,
+                domZ=10000,
+                threads=args.threads,
+                nter_method=args.nter_method,
+                cache_dir=cache_dir,
+                max_iteration=args.max_iteration,
+                res_dir=os.path.join(workdir,"run_pcalf"))
+
+    return {
+        "parameters":vars(args),
+        "proteomes":{"genomes":args.genomes,"sequences":n_sequences,"calcyanins":n_calcyanins},
+        "environment":{
+            "pcalf":_version("pcalf"),
+            "pyhmmer":pyhmmer.__version__,
+            "python":platform.python_version(),
+            "platform":platform.platform(),
+            "cpus":multiprocessing.cpu_count(),
+        },
+        "stages":results,
+    }
+
+
+def _version(package):
+    try:
+        return metadata.version(package)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def main():
+    args = get_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format="PCALF-BENCHMARK | [%(levelname)s] %(message)s")
+    if args.workdir:
+        os.makedirs(args.workdir,exist_ok=True)
+        report = run(args,os.path.abspath(args.workdir))
+    else:
+        with tempfile.TemporaryDirectory(prefix="pcalf-benchmark-") as workdir:
+            report = run(args,workdir)
+    with open(args.output,"w") as fh:
+        json.dump(report,fh,indent=2)
+    logging.info("Results saved in {}".format(args.output))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
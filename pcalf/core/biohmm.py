@@ -1,10 +1,16 @@
 import os
 import tqdm
+import hashlib
 import pyhmmer
 import logging
+import numpy as np
 
 #logger = logging.getLogger()
 
+# Hash functions (a*x+b) mod p of the MinHash signatures, see Hmm._minhash().
+_MINHASH_PRIME = np.uint64((1 << 61) - 1)
+_MINHASH_A, _MINHASH_B = np.random.RandomState(5).randint(1,(1 << 31) - 1,size=(2,64)).astype(np.uint64)
+
 class HmmIO:
     """Class to handle IO operation for Hmm object"""
     
@@ -66,6 +72,8 @@ class Hmm(HmmIO):
         self._msa = self.load_msa(msafile,msa_name) if msafile else None        
         self._hmm = self.hmmbuild(self.msa, **kwargs) if msafile else None
         self._msa_file = msafile        
+        self._members = None
+        self._signatures = {}
     
     @property
     def msa(self):
@@ -83,6 +91,8 @@ class Hmm(HmmIO):
     def msa(self, value):        
         if isinstance(value,pyhmmer.easel.MSA):                 
             self._msa = value
+            self._members = None
+            self._signatures = {}
         else:
             raise TypeError("value must be pyhmmer.easel.MSA")        
 
@@ -129,40 +139,53 @@ class Hmm(HmmIO):
         hmm = self.hmmbuild( msa )
         return msa,hmm
 
-    def _count_kmers(self,sequence, k_size=5):
-        data = {}
-        kmers = []
-        size = len(sequence)
-        for i in range(size - k_size + 1):
-            kmer = sequence[i: i + k_size]
-            kmers.append(kmer)
-            if kmer not in data:
-                data[kmer] = 1
-                continue        
-            data[kmer] += 1 
-
-        return data , kmers 
-
-    def _jaccard_similarity(self, a, b):
-        a = set(a)
-        b = set(b)
-        intersection = len(a.intersection(b))
-        union = len(a.union(b))
-        return intersection / union
-
+    @property
+    def members(self):
+        """Identity hash of the MSA sequences by name, built once and then maintained by hmmalign()."""
+        if self._members is None:
+            self._members = {seq.name:self._digest(seq) for seq in self.msa.sequences} if self.msa is not None else {}
+        return self._members
+
+    def _digest(self,sequence):
+        """Identity hash of a pyhmmer.easel.DigitalSequence."""
+        return hashlib.blake2b(np.asarray(sequence.sequence).tobytes(),digest_size=16).digest()
+
+    def _minhash(self,sequence,k_size=5):
+        """MinHash signature of the k-mers of a pyhmmer.easel.DigitalSequence."""
+        digits = np.asarray(sequence.sequence).astype(np.uint64)
+        n_kmers = len(digits) - k_size + 1
+        if n_kmers < 1:
+            return np.full(len(_MINHASH_A),_MINHASH_PRIME,dtype=np.uint64)
+        # digits are < 32, a k-mer is packed in k_size*5 bits.
+        kmers = np.zeros(n_kmers,dtype=np.uint64)
+        for i in range(k_size):
+            kmers |= digits[i:i+n_kmers] << np.uint64(5*i)
+        return ((_MINHASH_A[:,None]*kmers[None,:] + _MINHASH_B[:,None]) % _MINHASH_PRIME).min(axis=1)
+
+    def _signature(self,sequence):
+        """MinHash signature of a MSA sequence, computed once."""
+        if sequence.name not in self._signatures:
+            self._signatures[sequence.name] = self._minhash(sequence)
+        return self._signatures[sequence.name]
 
     def hmmalign(self,sequences:list,
                  self_include=True,
                  iterative = False,
                  trim=False,
-                 alphabet=pyhmmer.easel.Alphabet.amino()):
+                 alphabet=pyhmmer.easel.Alphabet.amino(),
+                 batch_size:int=None,
+                 max_rounds:int=None):
         """Align sequences to the hmm 
 
         Args:
           sequence (list): List of pyhmmer.easel.DigitalSequence - required
           self_include (bool): If set, sequences already present within the hmm will be added to the new hmm produced
+          iterative (bool): If set, the hmm is rebuilt after each new sequence, same as batch_size=1.
           trim (bool): N-ter/C-ter trimming, see pyhmmer.hmmalign documentation for details
           alphabet (pyhmmer.easel.Alphabet): Kind of alphabet to use.
+          batch_size (int): Number of sequences added to the alignment before the hmm is rebuilt. \
+            Default to 1 if iterative is set, all sequences at once otherwise.
+          max_rounds (int): If set, batch_size is increased so that the hmm is rebuilt at most max_rounds times.
 
         Raises:
             TypeError: If one sequence is not an instance of pyhmmer.easel.DigitalSequence.
@@ -171,44 +194,54 @@ class Hmm(HmmIO):
             Hmm -> A new Hmm object including the hmm profile and the multiple sequence alignment.
         """    
 
-        accs = {} # keep sequence name in a list 
+        accs = {} # new sequences by name
         for seq in sequences:            
             if isinstance(seq,pyhmmer.easel.DigitalSequence): 
-                accs[seq.name] = seq.textize().sequence
+                accs[seq.name] = seq
                 continue
             raise TypeError("TypeError, get {} while pyhmmer.easel.DigitalSequence was expected".format(
                 type(seq)
             ))            
-                
+        # Identity hashes and signatures only serve the duplicate report, they are maintained \
+        # in debug mode and otherwise built on request from the new MSA, see members.
+        debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+        members, signatures = None, {}
         if self_include: # Current MSA is kept.
             for seq in self.msa.sequences:
                 if seq.name not in accs:
                     sequences.append(seq)
-                else: # Duplicates      
-                    k_size = 5              
-                    _ , kmer_A = self._count_kmers(seq.textize().sequence,k_size= k_size)
-                    _ , kmer_B = self._count_kmers(accs[seq.name],k_size= k_size)
-                    jaccard = self._jaccard_similarity(kmer_A,kmer_B)
+                elif debug: # Duplicates, similarity is only reported.
+                    new_seq = accs[seq.name]
+                    if self.members[seq.name] == self._digest(new_seq):
+                        jaccard = 1.0
+                    else:
+                        jaccard = float(np.mean(self._signature(seq) == self._minhash(new_seq)))
                     logging.debug('{} already in HMM. Skip.'.format(seq.name.decode()))
-                    logging.debug("""Duplicate identifier : {}\nHMM seqlength: {};\nNEW seqlength: {};\n Jaccard similarity: {} [kmer length: {}]""".format(
+                    logging.debug("""Duplicate identifier : {}\nHMM seqlength: {};\nNEW seqlength: {};\n Jaccard similarity: {} [kmer length: {}, MinHash estimate]""".format(
                         seq.name.decode(),
-                        len(accs[seq.name]),
-                        len(seq.textize().sequence),
+                        len(seq),
+                        len(new_seq),
                         jaccard,
-                        k_size
+                        5
                     ))
+            if debug:
+                members = dict(self.members)
+                members.update((name,self._digest(seq)) for name, seq in accs.items())
+                signatures = {name:s for name, s in self._signatures.items() if name not in accs}
         
         hmm = self.hmm
         msa = self.msa
         no_seqs = len(sequences)
         logging.debug("Current No nodes within hmm : {} ".format(hmm.nseq) )
         logging.debug("# Sequences to align : {} ".format(no_seqs) )
+        if not batch_size:
+            batch_size = 1 if iterative else max(no_seqs,1)
+        if max_rounds:
+            batch_size = max(batch_size, -(-no_seqs // max_rounds))
+        logging.debug("# Sequences added per round : {} ".format(batch_size) )
         query = []
         while sequences:        
-            if not iterative:
-                query = [sequences.pop() for _ in range(no_seqs)]
-            else:                
-                query.append(sequences.pop())
+            query.extend(sequences.pop() for _ in range(min(batch_size,len(sequences))))
                                      
             msa, hmm = self._align(
                         query,
@@ -222,6 +255,8 @@ class Hmm(HmmIO):
         new_hmm = Hmm(hmm.name)
         new_hmm.hmm = hmm
         new_hmm.msa = msa     
+        new_hmm._members = members
+        new_hmm._signatures = signatures
         logging.debug("No of sequence in updated hmm/msa : {}/{}".format(
             hmm.nseq,len(msa.sequences)))
         return new_hmm
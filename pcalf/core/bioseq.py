@@ -17,6 +17,7 @@ import numpy as np
 import pandas as pd
 import pyhmmer.easel
 from   Bio import SeqIO
+from   Bio.Seq import Seq as BioSeq
 from   Bio.SeqRecord import SeqRecord
 from   Bio.SeqFeature import SeqFeature, FeatureLocation
 
@@ -55,6 +56,21 @@ class SequencesIO:
         Raises:
         FileNotFoundError; If fasta doesn't exist. 
         """     
+        return list(self._iter_fasta(fasta,src=src))
+
+    def _iter_fasta(self,fasta,src=""):
+        """Parse fasta file lazily, one Seq object at a time.
+
+        Args:
+        fasta: Path to  file or file-like object.
+        src (str): Name used to keep trace of the original file for each record.
+
+        Returns:
+        return a generator of Seq.
+
+        Raises:
+        FileNotFoundError; If fasta doesn't exist. 
+        """
         if isinstance(fasta,str):
             if not os.path.exists(fasta):
                 raise FileNotFoundError("{} not found".format(fasta))  
@@ -65,23 +81,75 @@ class SequencesIO:
         
         assert isinstance(fhl,io.TextIOWrapper)
 
-        sequences = []
-        ids = []
+        ids = set()
         #'ACDEFGHIKLMNPQRSTVWY-BJZOUX*~'
-        for record in SeqIO.parse(fhl,format="fasta"):            
-            if len(record.seq) < 10000:
-                #suffix = 1
-                if record.id in ids:
-                    #record.id = record.id + "_pcalf{}".format(suffix)
-                    logging.warning('Duplicate sequence identifier for {}. this one will be ignored...'.format(record.id))
-                    continue
-                    #suffix+=1
-                ids.append(record.id)            
-                record.seq = record.seq.strip()
-                sequences.append(Seq(record,src=src))
-            else:                
-                logging.warning("Sequence {} seems very long and can't be scan through hmmer".format(record.id))
-        return sequences
+        try:
+            for record in SeqIO.parse(fhl,format="fasta"):            
+                if len(record.seq) < 10000:
+                    if record.id in ids:
+                        logging.warning('Duplicate sequence identifier for {}. this one will be ignored...'.format(record.id))
+                        continue
+                    ids.add(record.id)            
+                    record.seq = record.seq.strip()
+                    yield Seq(record,src=src)
+                else:                
+                    logging.warning("Sequence {} seems very long and can't be scan through hmmer".format(record.id))
+        finally:
+            if fhl is not fasta:
+                fhl.close()
+
+    def _iter_digital_batches(self,fasta,src="",batch_size=10000,alphabet=pyhmmer.easel.Alphabet.amino()):
+        """Parse and digitize fasta file lazily with easel, batch_size sequences at a time. \
+        Sequences are filtered as in _iter_fasta() and keep the same identifier and description, \
+        residues are read in upper case.
+
+        Args:
+        fasta: Path to file or file-like object.
+        src (str): Name used to keep trace of the original file for each record.
+        batch_size (int): Maximum number of sequences per batch.
+        alphabet (pyhmmer.easel.Alphabet): Kind of alphabet to use.
+
+        Returns:
+        return a generator of pyhmmer.easel.DigitalSequenceBlock.
+
+        Raises:
+        FileNotFoundError; If fasta doesn't exist. 
+        """
+        if isinstance(fasta,str):
+            if not os.path.exists(fasta):
+                raise FileNotFoundError("{} not found".format(fasta))  
+            fhl = gzip.open(fasta,"rb") if fasta.endswith('.gz') else open(fasta,"rb")
+        else:
+            # easel reads binary handles only.
+            fhl = getattr(fasta,"buffer",fasta)
+
+        ids = set()
+        batch = pyhmmer.easel.DigitalSequenceBlock(alphabet)
+        try:
+            with pyhmmer.easel.SequenceFile(fhl,format="fasta",digital=True,alphabet=alphabet) as seq_file:
+                for dseq in seq_file:
+                    name = dseq.name.decode()
+                    if len(dseq) < 10000:
+                        if name in ids:
+                            logging.warning('Duplicate sequence identifier for {}. this one will be ignored...'.format(name))
+                            continue
+                        ids.add(name)
+                        # Biopython keeps the whole header as description.
+                        if dseq.description:
+                            dseq.description = dseq.name + b" " + dseq.description
+                        else:
+                            dseq.description = dseq.name
+                        batch.append(dseq)
+                        if len(batch) >= batch_size:
+                            yield batch
+                            batch = pyhmmer.easel.DigitalSequenceBlock(alphabet)
+                    else:
+                        logging.warning("Sequence {} seems very long and can't be scan through hmmer".format(name))
+        finally:
+            if fhl is not fasta:
+                fhl.close()
+        if len(batch):
+            yield batch
 
     def to_fasta(self , filehandle ):
         """Dump fasta records.
@@ -100,6 +168,40 @@ class SequencesIO:
         SeqIO.write(self.sequences, filehandle,format="fasta")
 
 
+def round_evalues(values):
+    """Round E-values to four significant digits, as float('{:0.3e}'.format(value)) would do.
+    
+    Args:
+        values (array like): E-values.
+    Raises:
+        None
+    Return:
+        np.ndarray of float.
+    """
+    values = np.asarray(values,dtype=float)
+    return np.array([float("%0.3e" % value) for value in values.tolist()],dtype=float)
+
+
+def round_values(values,ndigits):
+    """Round values to ndigits decimals, as round(value,ndigits) would do.
+    
+    Args:
+        values (array like): Values.
+        ndigits (int): Number of decimals.
+    Raises:
+        None
+    Return:
+        np.ndarray of float.
+    """
+    values = np.asarray(values,dtype=float)
+    scaled = values * 10**ndigits
+    rounded = np.rint(scaled) / 10**ndigits
+    # rint() rounds half to even the scaled value, not the value itself: values close to a tie are rounded by round().
+    ties = np.flatnonzero(np.abs(np.abs(scaled - np.floor(scaled)) - 0.5) < 1e-6)
+    rounded[ties] = [round(value,ndigits) for value in values[ties].tolist()]
+    return rounded
+
+
 class Hit:
     """Class to store scores and location of features.
     
@@ -114,6 +216,9 @@ class Hit:
         method (str): Method use to produced the hit.
         src (str): Additional information about the origin of the hit.
     """
+    __slots__ = ("hid","target_len","start_location","stop_location",
+                 "score","identity","coverage","method","src")
+
     def __init__(self,        
         hid="",
         target_len:int=0,
@@ -136,12 +241,188 @@ class Hit:
         self.method = method
         self.src = src
 
+    @classmethod
+    def from_rounded(cls,hid,target_len,start_location,stop_location,score,identity,coverage,method,src):
+        """Create a Hit from values already rounded (e.g by HitTable), skipping rounding."""
+        hit = cls.__new__(cls)
+        hit.hid = hid
+        hit.target_len = target_len
+        hit.start_location = start_location
+        hit.stop_location = stop_location
+        hit.score = score
+        hit.identity = identity
+        hit.coverage = coverage
+        hit.method = method
+        hit.src = src
+        return hit
+
+
+class Feature:
+    """Lightweight feature record: coordinates and qualifiers, a Bio.SeqFeature.SeqFeature \
+    is only created when its location or to_seqfeature() is requested.
+    
+    Attributes:
+        start (int): Start location (0-based, included).
+        end (int): End location (excluded).
+        id (str): Feature identifier.
+        type (str): Feature type.
+        qualifiers (dict): Feature qualifiers.
+    """
+    __slots__ = ("start","end","id","type","qualifiers","_seqfeature")
+
+    def __init__(self,start:int,end:int,id:str="<unknown id>",type:str="",qualifiers:dict=None):
+        self.start = start
+        self.end = end
+        self.id = id
+        self.type = type
+        self.qualifiers = qualifiers if qualifiers is not None else {}
+        self._seqfeature = None
+
+    def to_seqfeature(self):
+        """Convert to Bio.SeqFeature.SeqFeature, created once.
+        
+        Args:
+            None
+        Raises:
+            ValueError: If end is lower than start.
+        Return:
+            Bio.SeqFeature.SeqFeature
+        """
+        if self._seqfeature is None:
+            self._seqfeature = SeqFeature(
+                FeatureLocation(self.start,self.end),
+                id=self.id,
+                type=self.type,
+                qualifiers=self.qualifiers)
+        return self._seqfeature
+
+    @property
+    def location(self):
+        return self.to_seqfeature().location
+
+    def extract(self,parent_sequence):
+        """Extract the feature sequence from its parent sequence, see Bio.SeqFeature.SeqFeature.extract().
+        
+        Args:
+            parent_sequence (Bio.Seq.Seq or str): Parent sequence.
+        Raises:
+            None
+        Return:
+            Same type as parent_sequence.
+        """
+        return parent_sequence[self.start:self.end]
+
+
+class HitTable:
+    """Hits stored column by column, one NumPy array per Hit attribute. Search methods of \
+    Sequences store the hits they find in one HitTable per call, each Seq object keeps the \
+    range of its rows, see Seq.hits.
+
+    Attributes:
+        columns (tuple): Column names, the attributes of Hit.
+        arrays (dict): One np.ndarray per column.
+    """
+    columns = ("hid","target_len","start_location","stop_location",
+               "score","identity","coverage","method","src")
+    # identity is kept as given, an identity of 0 (not computed) is not written as 0.0.
+    dtypes = {
+        "hid":object,
+        "target_len":np.int64,
+        "start_location":np.int64,
+        "stop_location":np.int64,
+        "score":np.float64,
+        "identity":object,
+        "coverage":np.float64,
+        "method":object,
+        "src":object,
+    }
+
+    def __init__(self,**columns):
+        missing = set(self.columns) - set(columns)
+        if missing:
+            raise ValueError("Missing column(s) : {}".format(",".join(sorted(missing))))
+        self.arrays = {c:np.asarray(columns[c],dtype=self.dtypes[c]) for c in self.columns}
+        if len(set(len(v) for v in self.arrays.values())) != 1:
+            raise ValueError("Columns should have the same length.")
+
+    def __len__(self):
+        return len(self.arrays["hid"])
+
+    @classmethod
+    def from_hits(cls,hits):
+        """Build a HitTable from Hit objects.
+        
+        Args:
+            hits (list): List of Hit object.
+        Raises:
+            None
+        Return:
+            HitTable object.
+        """
+        return cls(**{c:[getattr(hit,c) for hit in hits] for c in cls.columns})
+
+    @classmethod
+    def from_rows(cls,rows):
+        """Build a HitTable from ranges of rows of other tables, the rows of the only table \
+        involved are shared if they are all taken in order.
+        
+        Args:
+            rows (list): List of (HitTable, start, stop) tuples.
+        Raises:
+            None
+        Return:
+            HitTable object.
+        """
+        tables = {}
+        for table, _, __ in rows:
+            tables.setdefault(id(table),table)
+        if len(tables) == 1:
+            table = rows[0][0]
+            if rows[0][1] == 0 and rows[-1][2] == len(table) and \
+                all(previous[2] == current[1] for previous, current in zip(rows,rows[1:])):
+                return table
+        if not tables:
+            return cls(**{c:[] for c in cls.columns})
+        tables = list(tables.values())
+        offsets = dict(zip(map(id,tables),np.cumsum([0] + [len(t) for t in tables[:-1]]).tolist()))
+        table = tables[0] if len(tables) == 1 else cls(**{
+            c:np.concatenate([t.arrays[c] for t in tables]) for c in cls.columns})
+        starts = np.array([offsets[id(t)] + start for t, start, _ in rows],dtype=np.int64)
+        lengths = np.array([stop - start for _, start, stop in rows],dtype=np.int64)
+        return table.take(np.repeat(starts - np.cumsum(lengths) + lengths,lengths) + np.arange(lengths.sum()))
+
+    def take(self,indices):
+        """Rows of the table at indices.
+        
+        Args:
+            indices (np.ndarray): Row indices.
+        Raises:
+            IndexError: If an index is out of bounds.
+        Return:
+            HitTable object.
+        """
+        return HitTable(**{c:v[indices] for c, v in self.arrays.items()})
+
+    def hits(self,start=0,stop=None):
+        """Create the Hit objects of a range of rows.
+        
+        Args:
+            start (int): First row.
+            stop (int): Last row (excluded), the end of the table if not set.
+        Raises:
+            None
+        Return:
+            list of Hit objects.
+        """
+        return [Hit.from_rounded(*row) for row in zip(*(self.arrays[c][start:stop].tolist() for c in self.columns))]
+
 
 class Seq(SeqRecord):  
     """Seq object extend the SeqRecord class from biopython
     
     Attributes:
         hits (list): List of Hit object if any. 
+        hit_count (int): Number of hits.
         res (dict): Dictionnary with residue as key.
     """   
 
@@ -154,7 +435,43 @@ class Seq(SeqRecord):
         self.hits = []
         self.res = {}
         self.sanitize_record()
+
+    @property
+    def hits(self):
+        """Hits found by the search methods of Sequences are stored in HitTable objects, their \
+        Hit objects are only created when this list is first requested. The list is then the \
+        reference, it can be modified in place."""
+        if self._hit_rows:
+            for table, start, stop in self._hit_rows:
+                self._hits.extend(table.hits(start,stop))
+            self._hit_rows = []
+        return self._hits
+
+    @hits.setter
+    def hits(self,value):
+        self._hits = value
+        self._hit_rows = []
+
+    @property
+    def hit_count(self):
+        return len(self._hits) + sum(stop - start for _, start, stop in self._hit_rows)
+
+    def _add_hit_rows(self,table,start,stop):
+        """Add the hits stored in a range of rows of a HitTable, after the other hits.
         
+        Args:
+            table (HitTable): HitTable object.
+            start (int): First row.
+            stop (int): Last row (excluded).
+        Raises:
+            None
+        Return:
+            None
+        """
+        if self._hit_rows and self._hit_rows[-1][0] is table and self._hit_rows[-1][2] == start:
+            self._hit_rows[-1] = (table,self._hit_rows[-1][1],stop)
+        elif stop > start:
+            self._hit_rows.append((table,start,stop))
 
     def sanitize_record(self):
         """Remove gap character from sequence if any (inplace).
@@ -250,6 +567,37 @@ class Seq(SeqRecord):
         self.hits.append(hit)        
 
 
+class _SeqList(list):
+    """List of Seq objects counting its modifications, see Sequences._sync().
+    
+    Attributes:
+        version (int): Incremented by each modification of the list.
+    """
+    version = 0
+
+    def _modified(method):
+        def wrapper(self,*args,**kwargs):
+            self.version += 1
+            return method(self,*args,**kwargs)
+        wrapper.__name__ = method.__name__
+        wrapper.__doc__ = method.__doc__
+        return wrapper
+
+    __setitem__ = _modified(list.__setitem__)
+    __delitem__ = _modified(list.__delitem__)
+    __iadd__ = _modified(list.__iadd__)
+    __imul__ = _modified(list.__imul__)
+    append = _modified(list.append)
+    extend = _modified(list.extend)
+    insert = _modified(list.insert)
+    pop = _modified(list.pop)
+    remove = _modified(list.remove)
+    clear = _modified(list.clear)
+    sort = _modified(list.sort)
+    reverse = _modified(list.reverse)
+    del _modified
+
+
 class Sequences(SequencesIO):
     """Class to handle multiple Seq object.
     
@@ -257,7 +605,110 @@ class Sequences(SequencesIO):
         sequences (list): List of Seq object if any.         
     """   
     def __init__(self,fasta=None,src="",**kwargs):        
-        self._sequences = self._parse_fasta(fasta,src=src) if fasta else []
+        self._sequences = _SeqList(self._parse_fasta(fasta,src=src) if fasta else [])
+        self._digital = None
+        self._reindex()
+
+    @classmethod
+    def iter_batches(cls,fasta,src="",batch_size=10000):
+        """Read a fasta file as a stream of digitized Sequences objects, see from_digital(). \
+        Sequences are parsed by easel and Seq objects are only created for sequences with a \
+        hit, by hmmsearch().
+        
+        Args:
+            fasta: Path to  file or file-like object.
+            src (str): Name used to keep trace of the original file for each record.
+            batch_size (int): Maximum number of sequences per Sequences object.
+        Raises:
+            FileNotFoundError; If fasta doesn't exist. 
+        Return:
+            generator of Sequences objects.
+        """
+        for block in cls()._iter_digital_batches(fasta,src=src,batch_size=batch_size):
+            yield cls.from_digital(block,src=src)
+
+    @classmethod
+    def from_records(cls,records,src=""):
+        """Build a Sequences object from plain records, see to_records().
+        
+        Args:
+            records (list): List of (identifier, description, sequence) tuples.
+            src (str): Name used to keep trace of the original file for each record.
+        Raises:
+            None
+        Return:
+            Sequences object.
+        """
+        sequences = cls()
+        sequences.sequences = [
+            Seq(SeqRecord(BioSeq(sequence),id=sid,name=sid,description=description),src=src)
+            for sid, description, sequence in records
+        ]
+        return sequences
+
+    @classmethod
+    def from_digital(cls,block,src=""):
+        """Build a Sequences object from already digitized sequences. Seq objects are \
+        only created for sequences with a hit, by hmmsearch().
+        
+        Args:
+            block (pyhmmer.easel.DigitalSequenceBlock): Digitized sequences, e.g from a SequenceCache.
+            src (str): Name used to keep trace of the original file for each record.
+        Raises:
+            TypeError: If block is not a pyhmmer.easel.DigitalSequenceBlock.
+        Return:
+            Sequences object.
+        """
+        if not isinstance(block,pyhmmer.easel.DigitalSequenceBlock):
+            raise TypeError("Except pyhmmer.easel.DigitalSequenceBlock but received {}".format(type(block)))
+        sequences = cls()
+        sequences._digital = block
+        sequences._src = src
+        return sequences
+
+    def _materialize(self,names):
+        """Create the Seq objects of digitized sequences, in the order of the block.
+        
+        Args:
+            names (set): Identifiers (bytes) of the sequences to create.
+        Raises:
+            None
+        Return:
+            None
+        """
+        self._sync()
+        for dseq in self._digital:
+            if dseq.name in names and dseq.name.decode() not in self._index:
+                text = dseq.textize()
+                sid = text.name.decode()
+                self.append(Seq(
+                    SeqRecord(BioSeq(text.sequence),id=sid,name=sid,description=text.description.decode()),
+                    src=self._src))
+
+    def count(self):
+        """Number of sequences, including digitized ones without Seq object.
+        
+        Args:
+            None
+        Raises:
+            None
+        Return:
+            int
+        """
+        return len(self._digital) if self._digital is not None else len(self._sequences)
+
+    def to_records(self,with_hits_only=False):
+        """Export sequences as plain (identifier, description, sequence) tuples, \
+        lighter than Seq objects to keep or send to another process.
+        
+        Args:
+            with_hits_only (bool): If set, only sequences with at least one hit are exported.
+        Raises:
+            None
+        Return:
+            list of tuples.
+        """
+        return [(seq.id,seq.description,str(seq.seq)) for seq in self._sequences if seq.hit_count or not with_hits_only]
 
     @property
     def sequences(self):
@@ -269,10 +720,77 @@ class Sequences(SequencesIO):
             for seq in value:
                 if not isinstance(seq,Seq):
                     raise TypeError("sequence is not a Seq object")
-            self._sequences = value
+            self._sequences = _SeqList(value)
+            self._digital = None
+            self._reindex()
         else:
             raise TypeError("value must be a list of Seq object")        
 
+    def _reindex(self):
+        """Rebuild the identifier -> Seq index, the first sequence wins on duplicated identifiers."""
+        if not isinstance(self._sequences,_SeqList):
+            self._sequences = _SeqList(self._sequences)
+        self._index = {}
+        for seq in self._sequences:
+            self._index.setdefault(seq.id,seq)
+        self._indexed = (self._sequences,self._sequences.version)
+
+    def append(self,seq):
+        """Add a single Seq object.
+        
+        Args:
+            seq (Seq): Seq object.
+        Raises:
+            TypeError: If seq is not an instance of Seq.
+        Return:
+            None
+        """
+        if not isinstance(seq,Seq):
+            raise TypeError("sequence is not a Seq object")
+        self._sync()
+        self._sequences.append(seq)
+        self._index.setdefault(seq.id,seq)
+        self._indexed = (self._sequences,self._sequences.version)
+
+    def extend(self,sequences:list):
+        """Add multiple Seq objects.
+        
+        Args:
+            sequences (list): List of Seq object.
+        Raises:
+            TypeError: If one sequence is not an instance of Seq.
+        Return:
+            None
+        """
+        for seq in sequences:
+            self.append(seq)
+
+    def merge(self,other):
+        """Concatenate another Sequences object into this one, indexes included.
+        
+        Args:
+            other (Sequences): Sequences object.
+        Raises:
+            TypeError: If other is not an instance of Sequences.
+        Return:
+            None
+        """
+        if not isinstance(other,Sequences):
+            raise TypeError("Except Sequences object not {}".format(type(other)))
+        self._sync()
+        other._sync()
+        self._sequences += other._sequences
+        for sid, seq in other._index.items():
+            self._index.setdefault(sid,seq)
+        self._indexed = (self._sequences,self._sequences.version)
+
+    def _sync(self):
+        """Rebuild the index if the list of sequences has been replaced or modified in place \
+        since it was indexed."""
+        indexed, version = self._indexed
+        if indexed is not self._sequences or version != getattr(self._sequences,"version",None):
+            self._reindex()
+
     def get_seq_by_id(self,sid:str):
         """Get a single sequence by its identifier.
         
@@ -283,9 +801,9 @@ class Sequences(SequencesIO):
         Return:
             Seq object
         """
-        for seq in self._sequences:
-            if seq.id == sid:
-                return seq
+        self._sync()
+        if sid in self._index:
+            return self._index[sid]
         raise ValueError("can't find {}".format(sid))
 
     def get_feature(self,feature_id=None):
@@ -333,10 +851,34 @@ class Sequences(SequencesIO):
             raise ValueError("Str1 and Str2 should have the same length.")
         return sum(chr1 != chr2 for chr1, chr2 in zip(str1, str2))/len(str1)     
 
+    def hamming_distances(self,str1s:list, str2s:list):
+        """Vectorized hamming_distance() over pairs of strings, comparison is case insensitive.
+        
+        Args:
+            str1s (list): First strings.
+            str2s (list): Second strings.
+        Raises:
+            ValueError: If two strings of a pair do not have the same length.
+        Return:
+            np.ndarray of float, one value per pair.
+        """
+        lengths = np.fromiter(map(len,str1s),dtype=np.int64,count=len(str1s))
+        if not np.array_equal(lengths,np.fromiter(map(len,str2s),dtype=np.int64,count=len(str2s))):
+            raise ValueError("Str1 and Str2 should have the same length.")
+        if not len(lengths):
+            return np.array([],dtype=float)
+        buffer1 = np.frombuffer("".join(str1s).lower().encode("latin-1"),dtype=np.uint8)
+        buffer2 = np.frombuffer("".join(str2s).lower().encode("latin-1"),dtype=np.uint8)
+        mismatches = np.concatenate([[0],np.cumsum(buffer1 != buffer2)])
+        ends = np.cumsum(lengths)
+        return (mismatches[ends] - mismatches[ends - lengths]) / lengths
+
     def hmmsearch(self,
                     hmms:list,
                     alphabet=pyhmmer.easel.Alphabet.amino(), 
                     cpus=multiprocessing.cpu_count()-1, 
+                    identity:bool=True,
+                    digital:list=None,
                     **kwargs):
         """Search sequences against  HMM profile(s).
         
@@ -344,6 +886,9 @@ class Sequences(SequencesIO):
             hmms (list): List of pyhmmer.plan7.HMM profile(s).
             alphabet (pyhmmer.easel.Alphabet): Kind of alphabet to use.
             cpus (int): Number of cpu to use.
+            identity (bool): If False, the hamming distance between target and HMM alignments \
+                is not computed and hits identity is set to 0.
+            digital (list): Sequences already digitized by digitize(), they are digitized here if not set.
         Raises:
             AssertionError: If hmms is not a list or of an HMM is not a .
             TypeError: If at least one profile within hmms is not a pyhmmer.plan7.HMM.
@@ -355,37 +900,197 @@ class Sequences(SequencesIO):
             if not isinstance(hmm, pyhmmer.plan7.HMM):
                 raise TypeError("Except pyhmmer.plan7.HMM but received {}".format(type(hmm)))
 
-        hits = pyhmmer.hmmsearch(hmms,self.digitize(alphabet),cpus=cpus,**kwargs)
+        if self._digital is not None:
+            hits = [top_hits for top_hits in pyhmmer.hmmsearch(hmms,self._digital,cpus=cpus,**kwargs)]
+            self._materialize({hit.name for top_hits in hits for hit in top_hits})
+        else:
+            hits = pyhmmer.hmmsearch(hmms,digital if digital is not None else self.digitize(alphabet),cpus=cpus,**kwargs)
         hmm_datas = [(h.name.decode("UTF-8"),h.M)  for h in hmms]
-        seq_with_hit = []
+        columns = {c:[] for c in ["seq","hid","target_len","start_location","stop_location","score","coverage","method","src"]}
+        target_alignments = []
+        hmm_alignments = []
         for hmm_datas , hit_by_hmm in zip(hmm_datas,hits):
             hmm_id,hmm_len=hmm_datas
             for hit in hit_by_hmm:
                 sequence_identifier = hit.name.decode("UTF-8")
-                if sequence_identifier not in seq_with_hit:
-                    seq_with_hit.append(sequence_identifier)
                 seq = self.get_seq_by_id(sequence_identifier)
                 for dom in hit.domains:
-                    
-                    dh = Hit(
-                            hid=hmm_id,
-                            target_len=hmm_len,
-                            start_location=dom.alignment.target_from,
-                            stop_location=dom.alignment.target_to,
-                            score = dom.i_evalue, # np.format_float_scientific( val ,precision=4) ,
-                            method="hmmsearch",
-                            coverage=(dom.alignment.target_to-dom.alignment.target_from)/hmm_len,#len(seq.seq),
-                            src = hmm_id,
-                            identity = round(
-                                self.hamming_distance(dom.alignment.target_sequence.lower(),dom.alignment.hmm_sequence.lower()),2)                            
-                        )
-                    seq.addhit(dh)
-
+                    columns["seq"].append(seq)
+                    columns["hid"].append(hmm_id)
+                    columns["target_len"].append(hmm_len)
+                    columns["start_location"].append(dom.alignment.target_from)
+                    columns["stop_location"].append(dom.alignment.target_to)
+                    columns["score"].append(dom.i_evalue)
+                    if identity:
+                        target_alignments.append(dom.alignment.target_sequence)
+                        hmm_alignments.append(dom.alignment.hmm_sequence)
+                    columns["coverage"].append((dom.alignment.target_to-dom.alignment.target_from)/hmm_len)
+                    columns["method"].append("hmmsearch")
+                    columns["src"].append(hmm_id)
+        if identity:
+            columns["identity"] = [round(d,2) for d in self.hamming_distances(target_alignments,hmm_alignments).tolist()]
+        else:
+            columns["identity"] = [0]*len(columns["seq"])
+        self._add_hits(**columns)
         return self
 
+    def _add_hits(self,seq,hid,target_len,start_location,stop_location,score,identity,coverage,method,src):
+        """Round scores in bulk and store hits in a new HitTable, ordered by sequence, the hits \
+        of a sequence being in the order they are given, see Seq.hits.
+        
+        Args:
+            seq (list): Seq object of each hit.
+            Others: One list per Hit attribute, see Hit.
+        Raises:
+            None
+        Return:
+            None
+        """
+        if not len(seq):
+            return
+        position = {id(s):i for i, s in enumerate(self._sequences)}
+        codes = np.fromiter(map(position.__getitem__,map(id,seq)),dtype=np.int64,count=len(seq))
+        table = HitTable(
+            hid=hid,
+            target_len=target_len,
+            start_location=start_location,
+            stop_location=stop_location,
+            score=round_evalues(score),
+            identity=[r if i else i for i, r in zip(identity,round_values(identity,3).tolist())],
+            coverage=round_values(coverage,2),
+            method=method,
+            src=src)
+        if len(codes) > 1 and (codes[1:] < codes[:-1]).any():
+            table = table.take(np.argsort(codes,kind="stable"))
+        counts = np.bincount(codes,minlength=len(self._sequences))
+        for owner, start, count in zip(self._sequences,(np.cumsum(counts) - counts).tolist(),counts.tolist()):
+            owner._add_hit_rows(table,start,start + count)
+
+    def _hit_rows(self):
+        """(HitTable, start, stop) ranges of rows of the hits of each sequence, in order. Hit \
+        objects already created are stored in a new HitTable."""
+        created = [hit for seq in self._sequences for hit in seq._hits]
+        table = HitTable.from_hits(created) if created else None
+        rows, offset = [], 0
+        for seq in self._sequences:
+            if seq._hits:
+                rows.append((table,offset,offset + len(seq._hits)))
+                offset += len(seq._hits)
+            rows.extend(seq._hit_rows)
+        return rows
+
+    def hit_counts(self):
+        """Number of hits of each sequence.
+        
+        Args:
+            None
+        Raises:
+            None
+        Return:
+            np.ndarray of int, one value per sequence.
+        """
+        return np.fromiter((seq.hit_count for seq in self._sequences),dtype=np.int64,count=len(self._sequences))
+
+    @property
+    def hit_table(self):
+        """HitTable of the hits of all sequences, in the order of sequences then of their hits. \
+        Rows are shared with the HitTable they are stored in if it holds them all in this order, \
+        e.g after sort_hits()."""
+        return HitTable.from_rows(self._hit_rows())
+
+    def _store_hits(self,table,counts):
+        """Move the hits of each sequence to table, which holds counts hits per sequence in order."""
+        for seq, start, count in zip(self._sequences,(np.cumsum(counts) - counts).tolist(),counts.tolist()):
+            seq.hits = []
+            seq._add_hit_rows(table,start,start + count)
+
+    def sort_hits(self):
+        """Sort the hits of each sequence by score (inplace), all hits are then stored in a single HitTable.
+        
+        Args:
+            None
+        Raises:
+            None
+        Return:
+            None
+        """
+        table = self.hit_table
+        counts = self.hit_counts()
+        # lexsort is stable, as list.sort() is.
+        self._store_hits(table.take(np.lexsort((table.arrays["score"],np.repeat(np.arange(len(counts)),counts)))),counts)
+
+    def filter_by_hit(self,hid):
+        """Only keep sequences with at least one hit against hid (inplace). Their hits are moved \
+        to a single HitTable so that rows of removed sequences are released.
+        
+        Args:
+            hid (str): Hit name, e.g a profile name.
+        Raises:
+            None
+        Return:
+            None
+        """
+        table = self.hit_table
+        counts = self.hit_counts()
+        seq_index = np.repeat(np.arange(len(counts)),counts)
+        keep = np.zeros(len(counts),dtype=bool)
+        keep[seq_index[table.arrays["hid"] == hid]] = True
+        self.sequences = [seq for seq, k in zip(self._sequences,keep.tolist()) if k]
+        self._store_hits(table.take(np.flatnonzero(keep[seq_index])),counts[keep])
 
+    def phmmer(self,
+                targets:pyhmmer.easel.DigitalSequenceBlock,
+                evalue:float=1e-4,
+                alphabet=pyhmmer.easel.Alphabet.amino(),
+                cpus=multiprocessing.cpu_count()-1):
+        """Perform an in-process sequence vs sequence search with phmmer and append \
+        resulting hits to the hits attribute of their respective sequence. Hits mimic blastp ones: \
+        locations are on the target and identity is a percentage.
+        
+        Args:
+            targets (pyhmmer.easel.DigitalSequenceBlock): Target sequences, e.g the N-ter database.
+            evalue (float): E-value threshold.
+            alphabet (pyhmmer.easel.Alphabet): Kind of alphabet to use.
+            cpus (int): Number of cpu to use.
+        Raises:
+            TypeError: If targets is not a pyhmmer.easel.DigitalSequenceBlock.
+        Return:
+            None
+        """
+        if not isinstance(targets,pyhmmer.easel.DigitalSequenceBlock):
+            raise TypeError("Except pyhmmer.easel.DigitalSequenceBlock but received {}".format(type(targets)))
+        if not self._sequences or not len(targets):
+            return self
+        target_len = {t.name:len(t.sequence) for t in targets}
+        columns = {c:[] for c in ["seq","hid","target_len","start_location","stop_location","score","identity","coverage","method","src"]}
+        for seq , hits in zip(self._sequences,pyhmmer.phmmer(self.digitize(alphabet),targets,cpus=cpus,E=evalue,domE=evalue)):
+            seq_hits = []
+            for hit in hits:
+                slen = target_len[hit.name]
+                sacc = hit.name.decode("UTF-8")
+                for dom in hit.domains:
+                    if not dom.reported:
+                        continue
+                    ali = dom.alignment
+                    pident = sum(c.isalpha() for c in ali.identity_sequence)/len(ali.identity_sequence)*100
+                    seq_hits.append((sacc,slen,ali.target_from,ali.target_to,dom.i_evalue,pident))
+            # best identity first, as for blastp.
+            seq_hits.sort(key=lambda x: x[-1], reverse=True)
+            for sacc,slen,sstart,send,score,pident in seq_hits:
+                columns["seq"].append(seq)
+                columns["hid"].append(sacc)
+                columns["target_len"].append(slen)
+                columns["start_location"].append(sstart)
+                columns["stop_location"].append(send)
+                columns["score"].append(score)
+                columns["identity"].append(pident)
+                columns["coverage"].append((send-sstart)/slen)
+                columns["method"].append("phmmer")
+                columns["src"].append(sacc)
+        self._add_hits(**columns)
+        return self
 
-    def blastp(self,blast_subject_fasta,evalue=1e-4,outfmt="10 std slen"):   
+    def blastp(self,blast_subject_fasta,evalue=1e-4,outfmt="10 std slen",db=None,threads=1):   
         """Perform a sequence vs sequence blastp search and append \ 
         resulting hits to the hits attribute of their respective sequence.
         
@@ -393,6 +1098,9 @@ class Sequences(SequencesIO):
             blast_subject_fasta (str): path to another fasta file.
             evalue (float): E-value threshold.
             outfmt (str): blast output format.
+            db (str): If set, path (prefix) to a BLAST database built from blast_subject_fasta, \
+                used instead of -subject, see search.make_nter_blastdb().
+            threads (int): Number of threads given to blastp, only used with db.
         Raises:
             OSError: If blastp command is not found.
             TypeError: If at least one profile within hmms is not a pyhmmer.plan7.HMM.
@@ -403,39 +1111,53 @@ class Sequences(SequencesIO):
         if blastpexec is None:
             #logging.critical("blastp command not found...")
             raise OSError("blastp command not found...")
+        # Queries are named after their position so that hits are fanned back to the right \
+        # sequence even if an identifier is shared by sequences from different sources, keys \
+        # are not numeric so that blastp doesn't parse them as GI numbers.
+        queries = {"q{}".format(i):seq for i, seq in enumerate(self._sequences)}
         query = tempfile.NamedTemporaryFile(mode="w+")
-        self.to_fasta(query)
+        for qacc, seq in queries.items():
+            query.write(">{}\n{}\n".format(qacc,seq.seq))
         query.flush()
-        if blastpexec:            
+        if blastpexec and db:
+            # Without -parse_seqids subject identifiers are stored as title.
+            command = [
+                    blastpexec,
+                    "-query" , query.name,
+                    "-db", db,
+                    "-num_threads", str(threads),
+                    "-evalue" , str(evalue),
+                    "-outfmt" , "10 qacc stitle pident length mismatch gapopen qstart qend sstart send evalue bitscore slen"
+                ]
+        elif blastpexec:            
             command = [
                     blastpexec,
                     "-query" , query.name,
                     "-subject", blast_subject_fasta,
                     "-evalue" , str(evalue),
-                    "-outfmt" , '"10 std slen"'                    
+                    "-outfmt" , "10 std slen"
                 ]
 
-        o = subprocess.run(" ".join(command) , capture_output=True , shell=True)         
+        # No shell, paths such as the BLAST database under cache_dir are passed as is.
+        o = subprocess.run(command , capture_output=True)
         res = o.stdout.decode('ascii').strip()
         if res:
             df = pd.read_table( StringIO(res)  , sep=","  , header=None )          
             df.columns = "qacc sacc pident length mismatch gapopen qstart qend sstart send evalue bitscore slen".split(" ")
-            df.sort_values("pident",inplace=True,ascending=False)    
+            df.sort_values("pident",inplace=True,ascending=False,kind="stable")    
             df.set_index("qacc",inplace=True)
-            df["coverage"] = df.apply(lambda x: (x.send-x.sstart) / x.slen * 100, axis=1 )
-            for _ , blastp_hit in df.iterrows():
-                dh = Hit(
-                        hid=blastp_hit.sacc,
-                        target_len=blastp_hit.slen,
-                        start_location=blastp_hit.sstart,
-                        stop_location=blastp_hit.send,
-                        score = blastp_hit.evalue,
-                        method="blastp",
-                        coverage=(blastp_hit.send-blastp_hit.sstart)/blastp_hit.slen ,
-                        src = blastp_hit.sacc,
-                        identity = blastp_hit.pident
-                    )
-                self.get_seq_by_id(_).addhit(dh)
+            self._add_hits(
+                seq=[queries[qacc] for qacc in df.index],
+                hid=df.sacc.tolist(),
+                target_len=df.slen.tolist(),
+                start_location=df.sstart.tolist(),
+                stop_location=df.send.tolist(),
+                score=df.evalue.tolist(),
+                identity=df.pident.tolist(),
+                coverage=((df.send-df.sstart)/df.slen).tolist(),
+                method=["blastp"]*len(df),
+                src=df.sacc.tolist(),
+            )
         return self        
 
     def to_feature_table(self,add_sequence=True,feature_id=""):
@@ -457,12 +1179,16 @@ class Sequences(SequencesIO):
                     if feature_id!=feature.id:
                         keep=False
                 if keep:
+                    if isinstance(feature,Feature):
+                        start, end = feature.start, feature.end
+                    else:
+                        start, end = feature.location.start, feature.location.end
                     f = [
                         seq.id,
                         seq.src,
                         feature.type,
-                        feature.location.start,
-                        feature.location.end,
+                        start,
+                        end,
                         feature.id,
                         feature.qualifiers["identity"],
                         feature.qualifiers["coverage"],
@@ -481,7 +1207,8 @@ class Sequences(SequencesIO):
         ]).set_index("sequence_id")
 
     def to_hits_table(self):
-        """Generate a hits table.
+        """Generate a hits table, one row per hit of each sequence. Columns are taken from \
+        the HitTable of hit_table.
         
         Args:
             self
@@ -490,24 +1217,16 @@ class Sequences(SequencesIO):
         Return:
             pd.DataFrame
         """          
-        hits_datas = []
-        for seq in self.sequences:
-            for hit in seq.hits:
-                f = [
-                    seq.id,
-                    seq.src,
-                    hit.target_len,                    
-                    hit.start_location,
-                    hit.stop_location,
-                    hit.score,
-                    hit.identity,
-                    hit.coverage,
-                    hit.method,
-                    hit.src
-                ]
-                hits_datas.append(f)
-        return pd.DataFrame(hits_datas,columns=[
-            "sequence_id","sequence_src","hit_target_len","hit_start","hit_stop",
-            "hit_e_value","hit_pident","hit_coverage","hit_method","hit_src"
-        ]).set_index("sequence_id")
-  
\ No newline at end of file
+        arrays = self.hit_table.arrays
+        counts = self.hit_counts()
+        return pd.DataFrame({
+            "sequence_src":np.repeat(np.array([seq.src for seq in self._sequences],dtype=object),counts),
+            "hit_target_len":arrays["target_len"],
+            "hit_start":arrays["start_location"],
+            "hit_stop":arrays["stop_location"],
+            "hit_e_value":arrays["score"],
+            "hit_pident":pd.Series(arrays["identity"],copy=False).infer_objects().to_numpy(),
+            "hit_coverage":arrays["coverage"],
+            "hit_method":arrays["method"],
+            "hit_src":arrays["src"],
+        },index=pd.Index(np.repeat(np.array([seq.id for seq in self._sequences],dtype=object),counts),name="sequence_id"),copy=False)
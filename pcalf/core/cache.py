@@ -0,0 +1,199 @@
+import os
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import contextlib
+import collections
+try:
+    import fcntl
+except ImportError: # not available on Windows, writers are then not serialized.
+    fcntl = None
+
+import numpy as np
+import pyhmmer.easel
+
+from .bioseq import Sequences
+
+
+def default_cache_dir():
+    """Directory where pcalf keeps data reused across runs.
+
+    Args:
+        None
+
+    Returns:
+    $PCALF_CACHE_DIR if set, else $XDG_CACHE_HOME/pcalf or ~/.cache/pcalf.
+
+    Raises:
+    None
+    """
+    if os.environ.get("PCALF_CACHE_DIR"):
+        return os.environ["PCALF_CACHE_DIR"]
+    xdg = os.environ.get("XDG_CACHE_HOME",os.path.join(os.path.expanduser("~"),".cache"))
+    return os.path.join(xdg,"pcalf")
+
+
+def file_digest(filename,chunk_size=1<<20):
+    """Compute the sha256 digest of a file content.
+
+    Args:
+        filename (str): Path to file.
+        chunk_size (int): Number of bytes read at once.
+
+    Returns:
+    hexadecimal digest (str).
+
+    Raises:
+    FileNotFoundError: If filename doesn't exist.
+    """
+    digest = hashlib.sha256()
+    with open(filename,"rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size),b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextlib.contextmanager
+def file_lock(filename):
+    """Hold an exclusive lock on filename.lock, e.g to read, update and write back a file \
+    shared by concurrent runs.
+
+    Args:
+        filename (str): Path to the file to protect, the lock file is created next to it.
+
+    Returns:
+    None
+
+    Raises:
+    OSError: If the lock file can't be created.
+    """
+    with open(filename + ".lock","a") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh,fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fh,fcntl.LOCK_UN)
+
+
+class SequenceCache:
+    """Digitized sequences of input fasta files, kept across iterations so that each \
+    file is parsed and digitized only once.
+
+    Blocks are kept in memory up to max_bytes, the least recently used ones are then \
+    spilled to disk and loaded back when needed. It is safe to share it between threads.
+
+    Attributes:
+        max_bytes (int): Memory budget, None for no limit.
+        spill_dir (str): Directory where evicted blocks are written.
+        alphabet (pyhmmer.easel.Alphabet): Alphabet used to digitize sequences.
+    """
+    def __init__(self,max_bytes=None,spill_dir=None,alphabet=pyhmmer.easel.Alphabet.amino()):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.alphabet = alphabet
+        self._blocks = collections.OrderedDict()
+        self._sizes = {}
+        self._spilled = {}
+        self._lock = threading.Lock()
+        self._own_spill_dir = False
+
+    def __len__(self):
+        return len(self._blocks) + len(self._spilled)
+
+    @property
+    def nbytes(self):
+        """Estimated size of blocks kept in memory."""
+        return sum(self._sizes.values())
+
+    def get(self,fasta,src=""):
+        """Return the digitized sequences of a fasta file, parsing it at first call.
+
+        Args:
+            fasta (str): Path to fasta file.
+            src (str): Name of the file, see Sequences.
+
+        Returns:
+        pyhmmer.easel.DigitalSequenceBlock.
+
+        Raises:
+        FileNotFoundError: If fasta doesn't exist.
+        """
+        key = (fasta,src)
+        with self._lock:
+            if key in self._blocks:
+                self._blocks.move_to_end(key)
+                return self._blocks[key]
+            spilled = self._spilled.pop(key,None)
+        if spilled:
+            block = self._load(spilled)
+            os.remove(spilled)
+        else:
+            block = pyhmmer.easel.DigitalSequenceBlock(
+                self.alphabet,
+                [seq.digitize(self.alphabet) for seq in Sequences()._iter_fasta(fasta,src=src)]
+            )
+        with self._lock:
+            self._blocks[key] = block
+            self._sizes[key] = sum(len(s) + len(s.name) + len(s.description) for s in block)
+            self._evict(keep=key)
+        return block
+
+    def _evict(self,keep):
+        """Spill least recently used blocks until the memory budget is met, the lock must be held."""
+        if self.max_bytes is None:
+            return
+        for key in list(self._blocks):
+            if self.nbytes <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            if self.spill_dir is None:
+                self.spill_dir = tempfile.mkdtemp(prefix="pcalf-sequences-")
+                self._own_spill_dir = True
+            path = os.path.join(self.spill_dir,"{}.npz".format(hashlib.sha256(repr(key).encode()).hexdigest()))
+            self._dump(self._blocks.pop(key),path)
+            self._spilled[key] = path
+            del self._sizes[key]
+            logging.debug("Sequences of {} spilled to {}".format(key[0],path))
+
+    def _dump(self,block,path):
+        """Write a block as concatenated digits, offsets, names and descriptions."""
+        lengths = np.array([len(s) for s in block],dtype=np.int64)
+        np.savez(
+            path,
+            digits=np.concatenate([np.asarray(s.sequence) for s in block]) if len(block) else np.array([],dtype=np.uint8),
+            offsets=np.concatenate([[0],np.cumsum(lengths)]),
+            names=np.array([s.name for s in block],dtype=bytes),
+            descriptions=np.array([s.description for s in block],dtype=bytes),
+        )
+
+    def _load(self,path):
+        """Read back a block written by _dump()."""
+        with np.load(path) as data:
+            digits, offsets = data["digits"], data["offsets"]
+            return pyhmmer.easel.DigitalSequenceBlock(self.alphabet,[
+                pyhmmer.easel.DigitalSequence(
+                    self.alphabet,
+                    name=bytes(name),
+                    description=bytes(description),
+                    sequence=bytearray(digits[start:stop].tobytes()))
+                for name, description, start, stop in zip(data["names"],data["descriptions"],offsets[:-1],offsets[1:])
+            ])
+
+    def close(self):
+        """Drop all blocks and remove spilled ones from disk."""
+        with self._lock:
+            self._blocks.clear()
+            self._sizes.clear()
+            for path in self._spilled.values():
+                if os.path.exists(path):
+                    os.remove(path)
+            self._spilled.clear()
+            if self._own_spill_dir:
+                shutil.rmtree(self.spill_dir,ignore_errors=True)
+                self.spill_dir = None
+                self._own_spill_dir = False
@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import time
+import logging
+import resource
+import threading
+import contextlib
+
+
+def reset_peak_rss():
+    """Reset the peak resident set size of the current process to its current RSS, \
+    see peak_rss_mb(). Only available on Linux.
+
+    Args:
+        None
+
+    Returns:
+    True if the peak has been reset, False otherwise.
+
+    Raises:
+    None
+    """
+    try:
+        with open("/proc/self/clear_refs","w") as fh:
+            fh.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def peak_rss_mb():
+    """Peak resident set size of the current process, since the last reset_peak_rss() if any.
+
+    Args:
+        None
+
+    Returns:
+    Peak RSS in MB (float).
+
+    Raises:
+    None
+    """
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, in kilobytes elsewhere.
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+class Profiler:
+    """Wall time, CPU time, peak RSS and number of items of each stage of a search, \
+    by genome and by iteration.
+
+    CPU time is the one of the whole process: stages run concurrently in threads share it. \
+    Peak RSS is the high water mark of the process while the stage runs: the peak is reset \
+    when a stage starts and folded into the stages still running beforehand. Where it can't \
+    be reset, peak_rss_scope is "process" and peak RSS is the high water mark of the process \
+    since it started. Records of worker processes are sent back to the parent one, see extend().
+    It is safe to share it between threads.
+
+    Attributes:
+        iteration (int): Iteration attached to new records, see run_pcalf().
+        records (list): One dict per stage run.
+    """
+    def __init__(self,iteration=None):
+        self.iteration = iteration
+        self.records = []
+        self._lock = threading.Lock()
+        self._peaks = {} # peak RSS of running stages, by record id.
+
+    def _fold_peak(self):
+        """Fold the current peak RSS into the peak of running stages, called with the lock held."""
+        peak = peak_rss_mb()
+        for key, value in self._peaks.items():
+            self._peaks[key] = max(value,peak)
+
+    @contextlib.contextmanager
+    def stage(self,name,genome=None,items=None,**fields):
+        """Time the enclosed block.
+
+        Args:
+            name (str): Stage name, e.g "parse" or "glyx3_search".
+            genome (str): Genome (src) processed, None if the stage covers all genomes.
+            items (int): Number of items processed, it can also be set on the yielded record.
+            fields: Other values to record, e.g the profile updated.
+
+        Returns:
+        The record (dict), filled when the block exits.
+
+        Raises:
+        None
+        """
+        record = {"stage":name,"iteration":self.iteration,"genome":genome,"items":items}
+        record.update(fields)
+        with self._lock:
+            self._fold_peak()
+            scope = "stage" if reset_peak_rss() else "process"
+            self._peaks[id(record)] = 0.0
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record["wall_time"] = time.perf_counter() - wall
+            record["cpu_time"] = time.process_time() - cpu
+            record["pid"] = os.getpid()
+            with self._lock:
+                self._fold_peak()
+                record["peak_rss_mb"] = self._peaks.pop(id(record))
+                record["peak_rss_scope"] = scope
+                self.records.append(record)
+
+    def extend(self,records):
+        """Add records of another Profiler, e.g from a worker process, at the current iteration.
+
+        Args:
+            records (list): Records of another Profiler.
+
+        Returns:
+        None
+
+        Raises:
+        None
+        """
+        with self._lock:
+            for record in records:
+                record["iteration"] = self.iteration
+                self.records.append(record)
+
+    def summary(self):
+        """Aggregate records by iteration and stage.
+
+        Args:
+            None
+
+        Returns:
+        A list of dicts with total wall time, CPU time and items and the max peak RSS, \
+        sorted by iteration then by decreasing wall time.
+
+        Raises:
+        None
+        """
+        totals = {}
+        with self._lock:
+            records = list(self.records)
+        for record in records:
+            key = (record["iteration"],record["stage"])
+            total = totals.setdefault(key,{
+                "iteration":record["iteration"],"stage":record["stage"],"calls":0,
+                "wall_time":0.0,"cpu_time":0.0,"items":0,"peak_rss_mb":0.0})
+            total["calls"] += 1
+            total["wall_time"] += record["wall_time"]
+            total["cpu_time"] += record["cpu_time"]
+            total["items"] += record["items"] or 0
+            total["peak_rss_mb"] = max(total["peak_rss_mb"],record["peak_rss_mb"])
+        return sorted(totals.values(),key=lambda t: (
+            -1 if t["iteration"] is None else t["iteration"], -t["wall_time"]))
+
+    def dump(self,filename):
+        """Write the summary and the records as JSON.
+
+        Args:
+            filename (str): Output file, e.g <res_dir>/profile.json.
+
+        Returns:
+        None
+
+        Raises:
+        OSError: If filename can't be written.
+        """
+        with self._lock:
+            records = list(self.records)
+        with open(filename,"w") as fh:
+            json.dump({"summary":self.summary(),"records":records},fh,indent=2)
+        logging.info("Profile saved in {}".format(filename))
+
+
+def stage(profiler,name,genome=None,items=None,**fields):
+    """Profiler.stage() if profiler is set, else a context doing nothing.
+
+    Args:
+        profiler (Profiler): Profiler object or None.
+        Others: See Profiler.stage().
+
+    Returns:
+    A context manager yielding a record (dict).
+
+    Raises:
+    None
+    """
+    if profiler is None:
+        return contextlib.nullcontext({})
+    return profiler.stage(name,genome=genome,items=items,**fields)
+
+
+def iter_stage(profiler,name,iterable,genome=None,count=None):
+    """Record the production of each item of a lazy iterable, e.g a stream of parsed batches.
+
+    Args:
+        profiler (Profiler): Profiler object or None.
+        name (str): Stage name.
+        iterable: Iterable of items.
+        genome (str): See Profiler.stage().
+        count (callable): Number of items of the stage for each produced item, 1 if not set.
+
+    Returns:
+    generator of the items of iterable.
+
+    Raises:
+    None
+    """
+    if profiler is None:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        with profiler.stage(name,genome=genome) as record:
+            item = next(iterator,StopIteration)
+            record["items"] = 0 if item is StopIteration else count(item) if count else 1
+        if item is StopIteration:
+            return
+        yield item
@@ -1,178 +1,53 @@
 import re
 import os
+import io
+import pickle
 import logging
+import hashlib
+import functools
 import tempfile
 import concurrent
 import concurrent.futures
+import shutil
+import subprocess
 import multiprocessing
 import yaml
+import importlib.util
+import numpy as np
 import pandas as pd
 from shutil import which
 
 import pyhmmer
 import tqdm
 
-from Bio.SeqFeature import SeqFeature, FeatureLocation
-
+from . import cache
+from . import profiling
 from .biohmm import Hmm
-from .bioseq  import Sequences , Hit, Seq
+from .bioseq  import Sequences, Feature
 
+# Methods producing N-ter hits, see Sequences.blastp() and Sequences.phmmer().
+NTER_METHODS = ("blastp","phmmer")
 
-def glyzips_to_features(seq,
-                        glyzip_evalue_threshold,
-                        glyzip_coverage_threshold,
-                        ):
+# Maximum number of families kept in the thresholds cache, the oldest ones are dropped first.
+THRESHOLDS_CACHE_SIZE = 512
 
-    seq.per_residue_annotation() # for each residue we create an empty list
-    
-    current = None
-    glyzip_hits = []
-    glyzip_frag_len = []        
-    fraglen = 0
-    for _,hits in seq.res.items():
-        # return a tuple (pos,res)
-        # none, one or multiple hit exists for this residue, best hit is at the the top of the list.        
-        if hits:                
-            # if hit(s) exists , keep only glyzip                
-            hits = [h for h in hits if h.hid in ["Gly1","Gly2","Gly3"]]
-            if hits:
-                # E-VALUE THRESHOLD          
-                if hits[0].score <= glyzip_evalue_threshold:        
-                    #The hit is below the E-value threshold, we keep it.
-                    if current and current.hid == hits[0].hid: 
-                        # The hit is the same as before, so we continue
-                        fraglen += 1
-                        continue    
-                    else: 
-                        # The hit is different from before, 
-                        # therefore we store residues that share the 
-                        # same annotation as a new feature.
-                        if current:           
-                            fraglen+=1                                              
-                            glyzip_hits.append(current)
-                            glyzip_frag_len.append(fraglen)                    
-                        # feature have changed.
-                        current = hits[0]           
-                        fraglen=0
-            # this residue do not have any hit. 
-            else:
-                if current:
-                    fraglen+=1
-                    glyzip_hits.append(current)
-                    glyzip_frag_len.append(fraglen)
-                current = None
-    # finally we add the final feature.
-    if current:
-        fraglen+=1                                              
-        glyzip_hits.append(current)
-        glyzip_frag_len.append(fraglen)
-    
+# Columnar formats of the tables written by dump_iteration(), both require pyarrow.
+COLUMNAR_FORMATS = {"parquet":".parquet","feather":".arrow"}
 
-    # COVERAGE THRESHOLD
-    valid_glyzip_hit = [ f for f,fl in zip(glyzip_hits,glyzip_frag_len)  if  fl/f.target_len >= glyzip_coverage_threshold ]        
-
-
-    # For each hit we create a feature 
-    for hit in valid_glyzip_hit:  
-        if hit.score:
-            f = SeqFeature(
-            FeatureLocation(
-                hit.start_location, 
-                hit.stop_location
-                ),
-            id=hit.hid,
-            type="domain", 
-            qualifiers={
-                "n_hits"  :1,
-                "score"   :  "{:.2e}".format(hit.score),
-                "src":"{}_HMM_Profile".format(hit.hid),
-                "src_len" : hit.target_len,
-                "coverage": hit.coverage,
-                "identity": hit.identity
-            })
-            seq.features.append( f )
-    return seq
-
-
-def glyx3_to_feature(
-    seq:Seq,
-    glyx3_evalue_threshold:float=1e-30,
-    glyx3_coverage_threshold:float=0.3,
-    ):
-    # We filter hits based on their e-value and the total coverage against the GlyX3 HMM profile.    
-    is_glyx3_feature_exist = False
-    hit_below_evalue_threshold = [ h for h in seq.hits if h.score <= glyx3_evalue_threshold and h.hid =="Glyx3"]             
-    if hit_below_evalue_threshold:          
-        start_glyx3 = min([h.start_location for h in hit_below_evalue_threshold])
-        end_glyx3 = max([h.stop_location for h in hit_below_evalue_threshold])
-        scores = min([str("{:.2e}".format(h.score)) for h in hit_below_evalue_threshold])            
-        coverage_on_glyx3 = (end_glyx3-start_glyx3)/hit_below_evalue_threshold[0].target_len
-        identity = min([str(h.identity) for h in hit_below_evalue_threshold])
-        range = ",".join([str(h.start_location)+":"+str(h.stop_location) for h in hit_below_evalue_threshold])
-        # COVERAGE THESHOLD 
-        if coverage_on_glyx3 >= glyx3_coverage_threshold:
-            f = SeqFeature(
-                FeatureLocation(
-                    start_glyx3, 
-                    end_glyx3
-                    ),
-                id="GlyX3",
-                type="domain", 
-                qualifiers={
-                    "n_hits":len(hit_below_evalue_threshold),
-                    "range":range,
-                    "score":scores,
-                    "src":"GlyX3_HMM_Profile",
-                    "src_len":hit_below_evalue_threshold[0].target_len,
-                    "coverage":coverage_on_glyx3,             
-                    "identity":identity
-                })
-            seq.features.append( f )   
-            is_glyx3_feature_exist = True 
-    return seq
-
-def nter_to_feature(
-    seq,
-    nter_evalue_threshold:float = 1e-07,
-    nter_coverage_threshold:float = 0.80,
-    ):
-    self_match = None
-    valid_match = []
-    nter_hits = [h for h in seq.hits if h.method=="blastp"]
-    if nter_hits:
-        for hit in nter_hits:
-            # E-value and coverage filtering.
-            if hit.score < nter_evalue_threshold and \
-                hit.coverage >= nter_coverage_threshold:
-
-                f = SeqFeature(
-                    FeatureLocation(
-                        hit.start_location, 
-                        hit.stop_location
-                        ),
-                    id="N-ter",
-                    type="domain", 
-                    qualifiers={
-                        "n_hits":len(seq.hits),
-                        "score":hit.score,
-                        "src":hit.hid,
-                        "src_len":hit.target_len,
-                        "coverage":hit.coverage,
-                        "identity":hit.identity
-                    })     
-                if hit.hid.split("||")[-1] == seq.id:
-                    self_match = f
-                else:
-                    valid_match.append(f)                                                        
-        if valid_match:
-            seq.features.append(valid_match[0]) # because we keep only the best hit - aka the nearest neighboor.
-        elif self_match:
-            seq.features.append(self_match) # because there is no nearest neighboor but a self match exist.
-        else:
-            pass # because there is not hit at all.
-    return seq
+# Low cardinality columns of each table, dictionary encoded in columnar formats.
+CATEGORICAL_COLUMNS = {
+    "features":["sequence_src","feature_type","feature_id","feature_src"],
+    "hits":["sequence_src","hit_method","hit_src"],
+    "summary":["sequence_src","flag","nter","nter_neighbor","cter"],
+}
 
-def hits_2_features(
+# Columns mixing numbers and numbers formatted as text, e.g GlyX3 scores, stored as numbers in columnar formats.
+NUMERIC_COLUMNS = {
+    "features":["pident","coverage","e-value"],
+}
+
+
+def _hits_2_feature_records(
             sequences,
             glyx3_evalue_threshold:float=1e-30,
             glyx3_coverage_threshold:float=0.3,
@@ -180,39 +55,275 @@ def hits_2_features(
             glyzip_coverage_threshold:float=0.7,
             nter_coverage_threshold:float = 0.80, 
             nter_evalue_threshold:float = 1e-07):
+    """Compute the features of all sequences at once from their hit table with grouped \
+    NumPy/pandas operations.
+
+    Args:
+        sequences (Sequences): Sequences object.
+        Others: See hits_2_features().
+    Raises:
+        None
+    Return:
+        list of (index of the sequence, Feature) tuples, ordered by sequence then as \
+        features are added to a sequence: GlyX3, glycine zippers and N-ter.
     """
+    seqs = sequences.sequences
+    arrays = sequences.hit_table.arrays
+    counts = sequences.hit_counts()
+    hits = pd.DataFrame({c:arrays[c] for c in ["hid","target_len","start_location","stop_location",
+                                                "score","identity","coverage","method"]})
+    hits["seq"] = np.repeat(np.arange(len(seqs)),counts)
+    # qualifiers take the values of the hits as Python objects, not as NumPy scalars.
+    values = {c:v.tolist() for c, v in arrays.items()}
+    seq_hid = hits.seq.to_numpy()
+    score = hits.score.to_numpy()
+    # rank of each hit once the hits of its sequence are sorted by score.
+    order = np.lexsort((score,seq_hid))
+    rank = np.empty(len(hits),dtype=np.int64)
+    rank[order] = np.arange(len(hits))
+    records = [] # (seq, part, order within part, Feature)
+
+    # GlyX3: hits below the E-value threshold are merged into one feature.
+    glyx3 = hits[(hits.hid == "Glyx3") & (hits.score <= glyx3_evalue_threshold)].copy()
+    glyx3_rows = glyx3.index.tolist()
+    glyx3["escore"] = ["{:.2e}".format(values["score"][i]) for i in glyx3_rows]
+    glyx3["sidentity"] = [str(values["identity"][i]) for i in glyx3_rows]
+    glyx3["range"] = [str(values["start_location"][i])+":"+str(values["stop_location"][i]) for i in glyx3_rows]
+    glyx3 = glyx3.groupby("seq",sort=True).agg(
+        start=("start_location","min"),
+        end=("stop_location","max"),
+        n_hits=("hid","size"),
+        range=("range",",".join),
+        target_len=("target_len","first"),
+        escore=("escore","min"),
+        sidentity=("sidentity","min"))
+    glyx3["coverage"] = (glyx3.end - glyx3.start)/glyx3.target_len
+    glyx3 = glyx3[glyx3.coverage >= glyx3_coverage_threshold]
+    for si, f in zip(glyx3.index.tolist(),glyx3.itertuples(index=False)):
+        records.append((si,0,0,Feature(int(f.start),int(f.end),id="GlyX3",type="domain",qualifiers={
+            "n_hits":int(f.n_hits),
+            "range":f.range,
+            "score":f.escore,
+            "src":"GlyX3_HMM_Profile",
+            "src_len":int(f.target_len),
+            "coverage":float(f.coverage),
+            "identity":f.sidentity})))
+
+    # Glycine zippers: the best glycine zipper hit of each segment of residues sharing the same \
+    # hits gives its annotation, consecutive segments with the same annotation form a fragment \
+    # whose length is compared to the profile length.
+    seqlen = np.array([len(s.seq) for s in seqs],dtype=np.int64)
+    start = np.maximum(hits.start_location.to_numpy(),1)
+    stop = np.minimum(hits.stop_location.to_numpy(),seqlen[seq_hid]+1) if len(hits) else start
+    valid = np.flatnonzero(start < stop)
+    if len(valid):
+        width = int(seqlen.max()) + 2
+        bounds = np.unique(np.concatenate([seq_hid[valid]*width + start[valid],seq_hid[valid]*width + stop[valid]]))
+        first = np.searchsorted(bounds,seq_hid[valid]*width + start[valid])
+        n_segments = np.searchsorted(bounds,seq_hid[valid]*width + stop[valid]) - first
+        # one (segment, hit) pair per segment covered by a hit.
+        pair_hit = np.repeat(valid,n_segments)
+        pair_segment = np.repeat(first,n_segments) + np.arange(n_segments.sum()) - np.repeat(np.cumsum(n_segments) - n_segments,n_segments)
+        covered = np.unique(pair_segment)
+        is_glyzip = hits.hid.isin(["Gly1","Gly2","Gly3"]).to_numpy()[pair_hit]
+        pair_hit, pair_segment = pair_hit[is_glyzip], pair_segment[is_glyzip]
+        best = np.lexsort((rank[pair_hit],pair_segment))
+        best = best[np.r_[True,pair_segment[best][1:] != pair_segment[best][:-1]]] if len(best) else best
+        segment_hit = pd.Series(pair_hit[best],index=pair_segment[best]).reindex(covered,fill_value=-1).to_numpy()
+        # segments whose best hit is above the E-value threshold are ignored.
+        keep = (segment_hit == -1) | (score[np.maximum(segment_hit,0)] <= glyzip_evalue_threshold)
+        covered, segment_hit = covered[keep], segment_hit[keep]
+        segment_seq = bounds[covered] // width
+        segment_len = bounds[covered+1] - bounds[covered]
+        hid_code = np.where(segment_hit >= 0,pd.Categorical(hits.hid).codes[np.maximum(segment_hit,0)],-1)
+        new_run = (hid_code >= 0) & ((hid_code != np.r_[-1,hid_code[:-1]]) | (segment_seq != np.r_[-1,segment_seq[:-1]]))
+        run_id = np.cumsum(new_run) - 1
+        in_run = hid_code >= 0
+        fraglen = np.bincount(run_id[in_run],weights=segment_len[in_run],minlength=int(new_run.sum()))
+        run_hit = segment_hit[new_run]
+        valid_run = (fraglen/hits.target_len.to_numpy()[run_hit] >= glyzip_coverage_threshold) & (score[run_hit] != 0)
+        run_seq = hits.seq.to_numpy()[run_hit]
+        for ri in np.flatnonzero(valid_run).tolist():
+            i = int(run_hit[ri])
+            records.append((int(run_seq[ri]),1,ri,Feature(values["start_location"][i],values["stop_location"][i],id=values["hid"][i],type="domain",qualifiers={
+                "n_hits":1,
+                "score":"{:.2e}".format(values["score"][i]),
+                "src":"{}_HMM_Profile".format(values["hid"][i]),
+                "src_len":values["target_len"][i],
+                "coverage":values["coverage"][i],
+                "identity":values["identity"][i]})))
+
+    # N-ter: best hit against another sequence (nearest neighbour), or the self match if it is the only one.
+    nter = hits[hits.method.isin(NTER_METHODS) & (hits.score < nter_evalue_threshold) & 
+                (hits.coverage >= nter_coverage_threshold)].copy()
+    nter["rank"] = rank[nter.index.to_numpy()]
+    nter["self"] = np.array([h.split("||")[-1] == seqs[si].id for h,si in zip(nter.hid.tolist(),nter.seq.tolist())],dtype=bool)
+    nter = nter.sort_values("rank")
+    best_nter = pd.concat([
+        nter[~nter.self].groupby("seq").head(1),
+        nter[nter.self].groupby("seq").tail(1)]).drop_duplicates("seq",keep="first")
+    for i, si in zip(best_nter.index.tolist(),best_nter.seq.tolist()):
+        records.append((si,2,0,Feature(values["start_location"][i],values["stop_location"][i],id="N-ter",type="domain",qualifiers={
+            "n_hits":int(counts[si]),
+            "score":values["score"][i],
+            "src":values["hid"][i],
+            "src_len":values["target_len"][i],
+            "coverage":values["coverage"][i],
+            "identity":values["identity"][i]})))
+
+    records.sort(key=lambda x: x[:3])
+    return [(si,f) for si,_,__,f in records]
+
+def hits_2_features(
+            sequences,
+            glyx3_evalue_threshold:float=1e-30,
+            glyx3_coverage_threshold:float=0.3,
+            glyzip_evalue_threshold:float=1e-5,
+            glyzip_coverage_threshold:float=0.7,
+            nter_coverage_threshold:float = 0.80, 
+            nter_evalue_threshold:float = 1e-07):
+    """Filter hits and convert them to features, appended to the features attribute of each \
+    sequence. Hits of each sequence are sorted by score (inplace).
+
     Args:
+        sequences (Sequences): Sequences object.
         glyx3_evalue_threshold (float): E-value threshold for glyx3.
         glyx3_coverage_threshold (float): Coverage theshold for glyx3.
         glyzip_evalue_threshold (float): E-value threshold for glycine zipper 3.6e-4.
         glyzip_coverage_threshold (float): Coverage threshold for glycine zipper 0.7.
         nter_coverage_threshold (float): Coverage threshold for blastp. 
         nter_evalue_threshold (float): E-value threshold for blastp.
+    Raises:
+        None
+    Return:
+        Sequences object.
     """
+    seqs = sequences.sequences
+    for si, feature in _hits_2_feature_records(
+            sequences,
+            glyx3_evalue_threshold,
+            glyx3_coverage_threshold,
+            glyzip_evalue_threshold,
+            glyzip_coverage_threshold,
+            nter_coverage_threshold,
+            nter_evalue_threshold):
+        seqs[si].features.append(feature)
+    sequences.sort_hits()
+    return sequences
+
+FEATURE_TABLE_COLUMNS = ["sequence_id","sequence_src","feature_type","feature_start","feature_end",
+            "feature_id","pident","coverage","e-value","feature_src","feature_target_len","feature_seq"]
+
+def hits_2_feature_table(
+            sequences,
+            glyx3_evalue_threshold:float=1e-30,
+            glyx3_coverage_threshold:float=0.3,
+            glyzip_evalue_threshold:float=1e-5,
+            glyzip_coverage_threshold:float=0.7,
+            nter_coverage_threshold:float = 0.80, 
+            nter_evalue_threshold:float = 1e-07):
+    """Same table as hits_2_features() followed by Sequences.to_feature_table(), \
+    Seq objects are left untouched.
 
-    #logging.info("Filtering GlyX3 hits and convert to feature.")
-    for seq in sequences.sequences:
-        glyx3_to_feature(
-            seq,
+    Args:
+        sequences (Sequences): Sequences object.
+        Others: See hits_2_features().
+    Raises:
+        None
+    Return:
+        pd.DataFrame, see Sequences.to_feature_table().
+    """
+    seqs = sequences.sequences
+    features = []
+    for si, f in _hits_2_feature_records(
+            sequences,
             glyx3_evalue_threshold,
-            glyx3_coverage_threshold
-        )
-        #logging.debug("Filtering glyzip for {}.".format(seq.id))
-        # Hit filtering and features creation.
-        # init per_residue_annotation 
-        glyzips_to_features(
-            seq,
+            glyx3_coverage_threshold,
             glyzip_evalue_threshold,
-            glyzip_coverage_threshold
-        )
+            glyzip_coverage_threshold,
+            nter_coverage_threshold,
+            nter_evalue_threshold):
+        seq = seqs[si]
+        features.append([seq.id,seq.src,f.type,f.start,f.end,f.id,f.qualifiers["identity"],f.qualifiers["coverage"],
+                         f.qualifiers["score"],f.qualifiers["src"],f.qualifiers["src_len"],str(f.extract(seq.seq))])
+    return pd.DataFrame(features,columns=FEATURE_TABLE_COLUMNS).set_index("sequence_id")
 
-        #logging.debug("Resolve N-ter nearest neighboor for {}.".format(seq.id))        
-        nter_to_feature(
-            seq,
-            nter_evalue_threshold,
-            nter_coverage_threshold
-        )
-    return sequences
+def load_nter_targets(nter_fa:str):
+    """Load the N-ter fasta file as a pyhmmer.easel.DigitalSequenceBlock, kept in memory \
+    as long as the file is not modified.
+    
+    Args:
+        nter_fa (str): Path to fasta file containing known N-ter sequences.
+    Raises:
+        FileNotFoundError: If nter_fa doesn't exist.
+    Return:
+        pyhmmer.easel.DigitalSequenceBlock
+    """
+    stat = os.stat(nter_fa)
+    return _load_nter_targets(nter_fa,stat.st_mtime_ns,stat.st_size)
+
+@functools.lru_cache(maxsize=4)
+def _load_nter_targets(nter_fa,mtime,size):
+    """helper function of load_nter_targets(), mtime and size are part of the cache key."""
+    with pyhmmer.easel.SequenceFile(nter_fa,digital=True,alphabet=pyhmmer.easel.Alphabet.amino()) as seq_file:
+        return seq_file.read_block()
+
+def make_nter_blastdb(nter_fa:str,cache_dir:str=None):
+    """Build a protein BLAST database from the N-ter fasta file with makeblastdb. \
+    Databases are keyed on the fasta content and reused as long as it doesn't change.
+
+    E-values of a search against the database are computed over the search space of the \
+    whole database, as for any blastp -db search, while blastp -subject computes them for each \
+    N-ter sequence. They are larger, roughly by the ratio of the database length to the length \
+    of the N-ter, so N-ter hits close to the N-ter E-value threshold may be dropped and the \
+    flags of their sequence may change. The database is only searched when it is requested, \
+    see pcalf().
+    
+    Args:
+        nter_fa (str): Path to fasta file containing known N-ter sequences.
+        cache_dir (str): Directory where databases are stored, see cache.default_cache_dir().
+    Raises:
+        FileNotFoundError: If nter_fa doesn't exist.
+    Return:
+        Path (prefix) to the BLAST database, None if makeblastdb is not available, failed \
+        or if the database can't be stored under cache_dir.
+    """
+    makeblastdbexec = which("makeblastdb")
+    if makeblastdbexec is None:
+        logging.warning("makeblastdb not found, N-ter will be searched with blastp -subject.")
+        return None
+    cache_dir = cache_dir if cache_dir else cache.default_cache_dir()
+    dbdir = os.path.join(cache_dir,"blastdb","nterdb-{}".format(cache.file_digest(nter_fa)))
+    db = os.path.join(dbdir,"nterdb")
+    if os.path.exists(dbdir):
+        logging.debug("Reuse N-ter BLAST database {}".format(db))
+        return db
+    try:
+        os.makedirs(os.path.dirname(dbdir),exist_ok=True)
+        tmpdir = tempfile.mkdtemp(dir=os.path.dirname(dbdir))
+    except OSError as e:
+        logging.warning("N-ter BLAST database can't be stored, N-ter will be searched with blastp -subject : {}".format(e))
+        return None
+    try:
+        shutil.copyfile(nter_fa,os.path.join(tmpdir,"nterdb.fa"))
+        o = subprocess.run(
+            [makeblastdbexec,"-in",os.path.join(tmpdir,"nterdb.fa"),"-dbtype","prot","-out",os.path.join(tmpdir,"nterdb")],
+            capture_output=True)
+    except OSError as e:
+        logging.warning("N-ter BLAST database can't be built, N-ter will be searched with blastp -subject : {}".format(e))
+        shutil.rmtree(tmpdir,ignore_errors=True)
+        return None
+    if o.returncode != 0:
+        logging.warning("makeblastdb failed, N-ter will be searched with blastp -subject : {}".format(
+            o.stderr.decode(errors="replace").strip()))
+        shutil.rmtree(tmpdir,ignore_errors=True)
+        return None
+    try:
+        os.rename(tmpdir,dbdir)
+    except OSError: # built concurrently by another run.
+        shutil.rmtree(tmpdir,ignore_errors=True)
+    logging.debug("N-ter BLAST database built : {}".format(db))
+    return db
 
 def search_calcyanin(fasta:str, 
             src:str,
@@ -223,60 +334,133 @@ def search_calcyanin(fasta:str,
             nter_fa:str='', 
             Z:int=10000,
             domZ:int=10000,
+            fused:bool=False,
+            cpus:int=multiprocessing.cpu_count()-1,
+            batch_size:int=None,
+            identity:bool=True,
+            nter_method:str="blastp",
+            nter_db:str=None,
+            candidates:bool=False,
+            sequence_cache:cache.SequenceCache=None,
+            profiler:profiling.Profiler=None,
             ):
     """Find calcyanin within a fasta file using several HMM 
     profiles and 'database' of known N-ter.
     
     Args:
-        fasta (str): Path to a fasta file - required.
+        fasta (str): Path to a fasta file - required. It can also be a list of records \
+            returned by a previous search with candidates set, see Sequences.from_records().
         src (str): will be attached to calcyanin. Useful when searching across multiple files.  
         glyx3_hmm (pyhmmer.plan7.HMM):  Glyx3 HMM profile - required
         gly1_hmm (pyhmmer.plan7.HMM): Gly1 HMM profile - required
         gly2_hmm (pyhmmer.plan7.HMM): Gly2 HMM profile - required
         gly3_hmm (pyhmmer.plan7.HMM): Gly3 HMM profile - required
         nter_fa (str): Path to fasta file containing known N-ter sequences - required
+        fused (bool): If set, sequences are digitized once and searched against the four profiles \
+            in a single hmmsearch, GlyX3 gating is applied afterwards. Requires a fixed Z to \
+            produce the same E-values as the two rounds search.
+        cpus (int): Number of cpu used by each hmmsearch.
+        batch_size (int): If set, the fasta file is streamed, digitized and searched batch_size sequences \
+            at a time, Seq objects are only created for sequences with a GlyX3 hit, see Sequences.iter_batches().
+        identity (bool): If False, identity of HMM hits is not computed (set to 0).
+        nter_method (str): Either "blastp" or "phmmer". phmmer runs in-process against \
+            a digitized copy of nter_fa loaded once per process, see load_nter_targets().
+        nter_db (str): BLAST database built from nter_fa, see make_nter_blastdb(). If set, blastp \
+            searches it with cpus threads instead of indexing nter_fa as a subject.
+        candidates (bool): If set, the search is fused and the records of sequences reported \
+            against any of the four profiles are returned too. Those are the only sequences an \
+            updated version of the profiles can plausibly hit.
+        sequence_cache (cache.SequenceCache): If set, digitized sequences of fasta are taken from \
+            it and Seq objects are only created for sequences with a hit. batch_size is then ignored.
+        profiler (profiling.Profiler): If set, parsing, digitization and each search are recorded for src.
     Raises:
         TypeError if one sequence is not an instance of pyhmmer.easel.DigitalSequence.
 
     Return:
-        Hmm object
+        Sequences object, or a tuple (Sequences, records) if candidates is set.
     """
 
-    # Setup sequences - Parse fasta into Sequences object 
-    sequences = Sequences(fasta,src=src)
+    fused = fused or candidates
+    candidate_records = []
+    glzips_easel_hmm = [gly1_hmm,gly2_hmm,gly3_hmm]
+    first_round_hmm = [glyx3_hmm] + glzips_easel_hmm if fused else [glyx3_hmm]
+    glyx3_id = glyx3_hmm.name.decode()
     
+    # Setup sequences - Parse fasta into Sequences object(s)
+    digitized = False # batches already digitized, see Sequences.from_digital().
+    if isinstance(fasta,list):
+        with profiling.stage(profiler,"parse",src,len(fasta)):
+            batches = [Sequences.from_records(fasta,src=src)]
+        fasta = "{} ({} candidates)".format(src,len(fasta))
+    elif sequence_cache is not None:
+        # the file is parsed and digitized at the first call only.
+        with profiling.stage(profiler,"digitize",src) as record:
+            batches = [Sequences.from_digital(sequence_cache.get(fasta,src=src),src=src)]
+            record["items"] = batches[0].count()
+        digitized = True
+    elif batch_size:
+        if Z is None:
+            logging.warning("Z is not set, E-values will depend on the batch size.")
+        batches = profiling.iter_stage(profiler,"parse",
+            Sequences.iter_batches(fasta,src=src,batch_size=batch_size),genome=src,count=Sequences.count)
+        digitized = True
+    else:
+        with profiling.stage(profiler,"parse",src) as record:
+            batches = [Sequences(fasta,src=src)]
+            record["items"] = batches[0].count()
+
     # 1) Search sequences against GlyX3 profile
     logging.debug("1) Search {} against GlyX3".format(fasta))
-    logging.debug("[{}] Number of seq : {}".format(glyx3_hmm.name.decode(), glyx3_hmm.nseq ))
-    logging.debug("[{}] Number of nodes : {}".format(glyx3_hmm.name.decode(), glyx3_hmm.M ))
+    for _ in first_round_hmm:
+        logging.debug("[{}] Number of seq : {}".format(_.name.decode(), _.nseq ))
+        logging.debug("[{}] Number of nodes : {}".format(_.name.decode(), _.M ))
     
-    # .hmmsearch() return only sequences with at least one hit.
-    sequences_out_glyx3_search = sequences.hmmsearch([glyx3_hmm],Z=Z, domZ=domZ )
-    logging.debug("Number of sequences out glyx3 search : {}".format(
-        len(sequences_out_glyx3_search.sequences)
-    ))
-    # We will only keep sequence with a glyX3 hit, thus we can free some memory.
-    del sequences 
-    sequences_out_glyx3_search.sequences = [s for s in sequences_out_glyx3_search.sequences if s.hits]    
+    sequences_out_glyx3_search = Sequences()
+    n_sequences = 0
+    for sequences in batches:
+        n_sequences += sequences.count()
+        digital = None
+        if not digitized:
+            with profiling.stage(profiler,"digitize",src,sequences.count()):
+                digital = sequences.digitize()
+        with profiling.stage(profiler,"glyx3_search",src,sequences.count()):
+            sequences.hmmsearch(first_round_hmm,cpus=cpus,identity=identity,Z=Z, domZ=domZ, digital=digital)
+        digital = None
+        if candidates:
+            candidate_records.extend(sequences.to_records(with_hits_only=True))
+        # We will only keep sequence with a glyX3 hit, thus we can free some memory.
+        sequences.filter_by_hit(glyx3_id)
+        sequences_out_glyx3_search.merge(sequences)
+    sequences = batches = None
+    logging.debug("Number of sequences searched : {}".format(n_sequences))
     logging.debug("[GlyX3] number of sequence with a hit against GlyX3  : {}".format(len(sequences_out_glyx3_search.sequences)))
 
     # We can then use those sequences for the next steps 
     # i.e, Glycine zipper annotation and N-ter comparison.
     # 2) Search GlyZip profiles
-    logging.debug("2) Search {} sequences against Glyzip HMM profiles".format(len(sequences_out_glyx3_search.sequences)))
-    glzips_easel_hmm = [gly1_hmm,gly2_hmm,gly3_hmm]
-    for _ in glzips_easel_hmm:
-        logging.debug("[{}] Number of seq : {}".format(_.name.decode(), _.nseq ))
-        logging.debug("[{}] Number of nodes : {}".format(_.name.decode(), _.M ))    
-    
-    sequences_out_glyx3_search.hmmsearch(glzips_easel_hmm, Z=Z ,domZ=domZ)
+    if not fused:
+        logging.debug("2) Search {} sequences against Glyzip HMM profiles".format(len(sequences_out_glyx3_search.sequences)))
+        for _ in glzips_easel_hmm:
+            logging.debug("[{}] Number of seq : {}".format(_.name.decode(), _.nseq ))
+            logging.debug("[{}] Number of nodes : {}".format(_.name.decode(), _.M ))    
+        
+        with profiling.stage(profiler,"glyzip_search",src,len(sequences_out_glyx3_search.sequences)):
+            sequences_out_glyx3_search.hmmsearch(glzips_easel_hmm, cpus=cpus, identity=identity, Z=Z ,domZ=domZ)
+    else:
+        logging.debug("2) Glyzip hits already collected during the fused search.")
 
     # 3) Compare sequence with known N-ter.
     if nter_fa:
-        logging.debug("3) blast {} sequences against known N-ters".format(len(sequences_out_glyx3_search.sequences)))
-        sequences_out_glyx3_search.blastp(nter_fa)
+        logging.debug("3) {} {} sequences against known N-ters".format(nter_method,len(sequences_out_glyx3_search.sequences)))
+        with profiling.stage(profiler,nter_method,src,len(sequences_out_glyx3_search.sequences)):
+            if nter_method == "phmmer":
+                sequences_out_glyx3_search.phmmer(load_nter_targets(nter_fa),cpus=cpus)
+            else:
+                sequences_out_glyx3_search.blastp(nter_fa,db=nter_db,threads=cpus)
     else:
         logging.debug("3) Skip n-ter detection as no fasta file is provided.")
+    if candidates:
+        return sequences_out_glyx3_search, candidate_records
     return sequences_out_glyx3_search
 
 def _search_calcyanin_mt(args):    
@@ -285,6 +469,59 @@ def _search_calcyanin_mt(args):
     # logging.debug("memory usage : {}".format(mem))
     return search_calcyanin(*args) # return a Sequences object # bioseq.py
 
+# HMM profiles deserialized once per worker process, see _init_search_worker().
+_WORKER_HMMS = None
+
+def _hmm_to_bytes(hmm):
+    """Serialize a pyhmmer.plan7.HMM in binary format."""
+    buffer = io.BytesIO()
+    hmm.write(buffer,binary=True)
+    return buffer.getvalue()
+
+def _hmm_from_bytes(datas):
+    """Load a pyhmmer.plan7.HMM serialized with _hmm_to_bytes()."""
+    with pyhmmer.plan7.HMMFile(io.BytesIO(datas)) as hmm_file:
+        return hmm_file.read()
+
+def _init_search_worker(hmms):
+    """Initializer of the process pool : load the four profiles once per worker."""
+    global _WORKER_HMMS
+    _WORKER_HMMS = [_hmm_from_bytes(h) for h in hmms]
+
+def _search_calcyanin_mp(args):
+    """helper function to run search_calcyanin() from a worker process. If profiling is \
+    enabled, records of the worker are returned along with the result."""
+    fasta_file, src, *others, profile = args
+    if not profile:
+        return search_calcyanin(fasta_file, src, *_WORKER_HMMS, *others)
+    profiler = profiling.Profiler()
+    return search_calcyanin(fasta_file, src, *_WORKER_HMMS, *others, None, profiler), profiler.records
+
+def _write_checkpoint(result,filename):
+    """Pickle the result of a file search, the file only appears once fully written."""
+    with tempfile.NamedTemporaryFile(mode="wb",dir=os.path.dirname(filename),delete=False) as tmp:
+        pickle.dump(result,tmp,protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp.name,filename)
+
+def schedule(n_tasks:int, threads:int=None, jobs:int=None):
+    """Split threads between files searched concurrently and hmmsearch workers.
+
+    Args:
+        n_tasks (int): Number of files to search.
+        threads (int): Total number of threads, default to the number of cpu.
+        jobs (int): Number of files searched concurrently, default to as many as possible.
+    Raises:
+        None
+    Return:
+        A tuple (jobs, cpus) where cpus is the number of cpu used by each hmmsearch.
+    """
+    threads = threads if threads else multiprocessing.cpu_count()
+    if not jobs:
+        jobs = min(max(n_tasks,1),threads)
+    jobs = max(1,min(jobs,threads))
+    cpus = max(1,threads // jobs)
+    return jobs, cpus
+
 def search_calcyanin_concurrent(fastas:list,  
                     srcs:list,                                
                     glyx3_hmm:Hmm, 
@@ -293,7 +530,20 @@ def search_calcyanin_concurrent(fastas:list,
                     gly3_hmm:Hmm,
                     nter_fa:str, 
                     Z:int=10000,
-                    domZ:int=10000
+                    domZ:int=10000,
+                    fused:bool=False,
+                    threads:int=None,
+                    jobs:int=None,
+                    backend:str="thread",
+                    batch_size:int=None,
+                    identity:bool=True,
+                    nter_method:str="blastp",
+                    nter_db:str=None,
+                    batch_nter:bool=False,
+                    candidates:dict=None,
+                    sequence_cache:cache.SequenceCache=None,
+                    profiler:profiling.Profiler=None,
+                    checkpoint_dir:str=None,
             ):
     """Wrapper to run multiple file at once with the function _search_calcyanin.
     
@@ -305,9 +555,30 @@ def search_calcyanin_concurrent(fastas:list,
         gly2_hmm (pyhmmer.plan7.HMM): Gly2 HMM profile - required
         gly3_hmm (pyhmmer.plan7.HMM): Gly3 HMM profile - required
         nter_fa (str): Path to fasta file containing known N-ter sequences - required
+        fused (bool): Search the four profiles in a single hmmsearch, see search_calcyanin().
+        threads (int): Total number of threads, see schedule().
+        jobs (int): Number of files searched concurrently, see schedule().
+        backend (str): Either "thread" or "process". The process backend is not limited by the GIL \
+            during parsing and hits processing.
+        batch_size (int): Stream each file batch_size sequences at a time, see search_calcyanin().
+        identity (bool): If False, identity of HMM hits is not computed.
+        nter_method (str): N-ter search method, either "blastp" or "phmmer".
+        nter_db (str): BLAST database built from nter_fa, see make_nter_blastdb().
+        batch_nter (bool): If set, N-ter are not searched file by file but once for all the \
+            GlyX3 positive sequences, with all threads.
+        candidates (dict): Records of the sequences worth searching again, by src. If empty, \
+            it is filled by this search, otherwise only those records are searched \
+            instead of the fasta files, see search_calcyanin().
+        sequence_cache (cache.SequenceCache): Digitized sequences reused across calls, only \
+            supported by the thread backend.
+        profiler (profiling.Profiler): If set, stages of each file are recorded, see search_calcyanin().
+        checkpoint_dir (str): If set, the result of each file is saved in this directory as soon as \
+            it is available, and files whose result is already there are not searched again. \
+            Results are only reused with the same profiles and search parameters.
 
     Raises:
         AssertionError if one hmm is not an instance of Hmm.
+        ValueError if backend is unknown.
 
     Return:
         Hmm object
@@ -319,42 +590,77 @@ def search_calcyanin_concurrent(fastas:list,
     assert isinstance(gly3_hmm, Hmm)
     assert len(srcs)==len(fastas)
 
-    pools = []
-    l = []
-    for fasta_file,src in zip(fastas,srcs):
-        pools.append(
-            (fasta_file,
-            src,
-            glyx3_hmm.hmm,
-            gly1_hmm.hmm,
-            gly2_hmm.hmm,
-            gly3_hmm.hmm,
-            nter_fa,
-            Z,
-            domZ
-            )
-        )
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=multiprocessing.cpu_count()-1) as executor:
-        
-        l+=list(tqdm.tqdm(executor.map(_search_calcyanin_mt, pools), total=len(pools) , colour="CYAN") )
-    
-    # concatenate Sequences objects
+    jobs, cpus = schedule(len(fastas), threads, jobs)
+    logging.debug("Search {} files [backend: {}, concurrent files: {}, cpus per hmmsearch: {}]".format(
+        len(fastas), backend, jobs, cpus))
+
+    hmms = [glyx3_hmm.hmm, gly1_hmm.hmm, gly2_hmm.hmm, gly3_hmm.hmm]
+    # workers skip the N-ter search when it is done once afterwards.
+    worker_nter_fa = '' if batch_nter else nter_fa
+    keep_candidates = candidates is not None and not candidates
+    checkpoints = [None] * len(fastas)
+    done = {}
+    if checkpoint_dir:
+        parameters = [_hmm_digest(h) for h in hmms] + [
+            cache.file_digest(worker_nter_fa) if worker_nter_fa else "",
+            str(Z), str(domZ), str(fused), str(identity), nter_method, str(keep_candidates)]
+        checkpoints = [os.path.join(checkpoint_dir,"{}.pkl".format(hashlib.sha256(
+            "|".join([src,fasta_file] + parameters).encode()).hexdigest()))
+            for fasta_file, src in zip(fastas,srcs)]
+        for i, checkpoint in enumerate(checkpoints):
+            if os.path.exists(checkpoint):
+                with open(checkpoint,"rb") as fh:
+                    done[i] = pickle.load(fh)
+        logging.info("{}/{} files already searched, results loaded from {}".format(len(done),len(fastas),checkpoint_dir))
+        os.makedirs(checkpoint_dir,exist_ok=True)
+    if candidates:
+        fastas = [candidates[src] for src in srcs]
+    pending = [i for i in range(len(fastas)) if i not in done]
+    if backend == "thread":
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+        worker = _search_calcyanin_mt
+        pools = [(fasta_file, src, *hmms, worker_nter_fa, Z, domZ, fused, cpus, batch_size, identity, nter_method, nter_db, keep_candidates, sequence_cache, profiler) for fasta_file, src in ((fastas[i],srcs[i]) for i in pending)]
+    elif backend == "process":
+        if sequence_cache is not None:
+            logging.warning("The sequence cache can't be shared with worker processes, it is ignored.")
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_search_worker,
+            initargs=([_hmm_to_bytes(h) for h in hmms],))
+        worker = _search_calcyanin_mp
+        pools = [(fasta_file, src, worker_nter_fa, Z, domZ, fused, cpus, batch_size, identity, nter_method, nter_db, keep_candidates, profiler is not None) for fasta_file, src in ((fastas[i],srcs[i]) for i in pending)]
+    else:
+        raise ValueError("Unknown backend {}, expect thread or process.".format(backend))
+
+    # concatenate Sequences objects as soon as they are available, in the order of fastas.
     sequences = Sequences()
-    for e in l:
-        sequences.sequences += e.sequences
-    return sequences
+    with executor:
+        results = iter(tqdm.tqdm(executor.map(worker, pools), total=len(pools) , colour="CYAN"))
+        for i, src in enumerate(srcs):
+            if i in done:
+                e = done.pop(i)
+            else:
+                e = next(results)
+                if backend == "process" and profiler is not None:
+                    e, records = e
+                    profiler.extend(records)
+                if checkpoint_dir:
+                    _write_checkpoint(e,checkpoints[i])
+            if keep_candidates:
+                e, candidates[src] = e
+            sequences.merge(e)
+    if keep_candidates:
+        logging.debug("{} candidates kept for the next searches.".format(sum(len(c) for c in candidates.values())))
 
-def _modifyline(string,val):
-    """Modify the weight of Glycine residue"""
-    liste = string.split()
-    if len(liste) >= 21:
-        liste[6] = str(val*float(liste[6]))
-    elif len(liste) == 20:
-        liste[5] = str(val*float(liste[5]))
-    else : 
-        return string
-    return("  ".join(liste))
+    if batch_nter and nter_fa:
+        logging.debug("{} {} sequences from {} files against known N-ters".format(
+            nter_method,len(sequences.sequences),len(fastas)))
+        with profiling.stage(profiler,nter_method,items=len(sequences.sequences)):
+            if nter_method == "phmmer":
+                sequences.phmmer(load_nter_targets(nter_fa),cpus=jobs*cpus)
+            else:
+                sequences.blastp(nter_fa,db=nter_db,threads=jobs*cpus)
+    return sequences
 
 def increase_glycine_weight(hmm,pc):
     """Increase weight of Glycine within a hmm profile.
@@ -367,42 +673,67 @@ def increase_glycine_weight(hmm,pc):
     Return:
         weighted pyhmmer.plan7.HMM
     """
-    # dump hmm as tmpfile
-    tmp = tempfile.NamedTemporaryFile(mode="wb")
-    hmm.hmm.write(tmp,binary=False)
-    tmp.flush()
-    # update lines 
-    start =  True
+    weighted = hmm.hmm.copy()
+    glycine = weighted.alphabet.symbols.index("G")
+    # Scaling the -log(p) of Glycine emissions by 1-pc, as they are written in a 
+    # HMMER text file, is the same as raising the emission probabilities to the power 1-pc.
     val = 1 - pc
-    l = []
-    with open(tmp.name,"r") as fin:
-        for line in fin:
-            if start:
-                res = re.match(".*COMPO.*",line)
-                if res:
-                    start = False
-                    newline = _modifyline(line,val)+"\n"
-                else:
-                    newline = line
-            else:
-                    newline = _modifyline(line,val)+"\n"
-            l.append(newline)    
-    tmp = tempfile.NamedTemporaryFile(mode="w")
-    with open(tmp.name,'wb') as fout:
-        for _ in l:
-            tmp.write(_)
-    tmp.flush()
-    
-    with pyhmmer.plan7.HMMFile( tmp.name ) as hmm_file:
-        hmm = hmm_file.read()
+    for emissions in (weighted.match_emissions,weighted.insert_emissions):
+        emissions = np.asarray(emissions)
+        emissions[:,glycine] **= val
+    if weighted.composition is not None:
+        composition = np.asarray(weighted.composition)
+        composition[glycine] **= val
+    return weighted
+
+def load_weighted_hmm(msa_name:str,msafile:str,pc:float=0.2,cache_dir:str=None):
+    """Build a Hmm from a MSA file and increase its Glycine weight, see increase_glycine_weight(). \
+    The weighted profile is stored in binary format under cache_dir and loaded back by the next \
+    runs, as long as the MSA, the weight factor and pyhmmer version are the same.
+
+    Args:
+        msa_name (str): Name of the msa/hmm object.
+        msafile (str): Path to the alignment file.
+        pc (float): weigth factor.
+        cache_dir (str): Directory where profiles are stored, see cache.default_cache_dir().
+    Raises:
+        FileNotFoundError: If msafile doesn't exist.
+    Return:
+        Hmm object.
+    """
+    cache_dir = cache_dir if cache_dir else cache.default_cache_dir()
+    # the trailing version must be bumped whenever increase_glycine_weight() changes.
+    key = "|".join([cache.file_digest(msafile),msa_name,str(pc),"BLOSUM90",pyhmmer.__version__,"2"])
+    path = os.path.join(cache_dir,"hmm","{}.h3m".format(hashlib.sha256(key.encode()).hexdigest()))
+    hmm = Hmm(msa_name)
+    hmm.msa = hmm.load_msa(msafile,msa_name)
+    hmm.msa_file = msafile
+    if os.path.exists(path):
+        logging.debug("{}: load weighted profile from {}".format(msa_name,path))
+        with pyhmmer.plan7.HMMFile(path) as hmm_file:
+            hmm.hmm = hmm_file.read()
+        return hmm
+    hmm.hmm = hmm.hmmbuild(hmm.msa)
+    hmm.hmm = increase_glycine_weight(hmm,pc)
+    try:
+        os.makedirs(os.path.dirname(path),exist_ok=True)
+        with tempfile.NamedTemporaryFile(mode="wb",dir=os.path.dirname(path),delete=False) as tmp:
+            hmm.hmm.write(tmp,binary=True)
+        os.replace(tmp.name,path)
+    except OSError as e:
+        logging.warning("{}: weighted profile can't be cached : {}".format(msa_name,e))
     return hmm
 
-def update_hmm(l_seq,hmm,is_update_iterative=True):
+def update_hmm(l_seq,hmm,is_update_iterative=True,batch_size=None,max_rounds=None,profiler=None):
     """Update Hmm by aligning sequences against it
     
     Args:
         l_seq (list): List of Seq object.
         hmm (Hmm): Hmm object.
+        is_update_iterative (bool): Rebuild the hmm after each sequence.
+        batch_size (int): Number of sequences aligned between two rebuilds, see Hmm.hmmalign().
+        max_rounds (int): Maximum number of rebuilds, see Hmm.hmmalign().
+        profiler (profiling.Profiler): If set, the Glycine reweighting is recorded.
     Raises:
         None
     Return:
@@ -415,10 +746,11 @@ def update_hmm(l_seq,hmm,is_update_iterative=True):
         len(l_digital_seq)))
     logging.info("Number of sequences and nodes in HMM : {}, {}".format(
         hmm.hmm.nseq,hmm.hmm.M))
-    new_hmm = hmm.hmmalign(l_digital_seq , iterative = is_update_iterative)
+    new_hmm = hmm.hmmalign(l_digital_seq , iterative = is_update_iterative, batch_size=batch_size, max_rounds=max_rounds)
     logging.info("Number of sequences and nodes in updated HMM : {}, {}".format(
         new_hmm.hmm.nseq,new_hmm.hmm.M))
-    new_hmm.hmm = increase_glycine_weight( new_hmm , 0.2 )
+    with profiling.stage(profiler,"reweight",profile=hmm.hmm.name.decode()):
+        new_hmm.hmm = increase_glycine_weight( new_hmm , 0.2 )
 
     return new_hmm
 
@@ -444,18 +776,113 @@ def get_coverage_and_evalue_threshold(features_table,feature_src):
             max_e_value = e_value   
     return float('{:3e}'.format(max_e_value*10)),round(min_coverage-0.1,1)
 
-def auto_thresholds(reference,glyx3,gly1,gly2,gly3,Z,domZ):    
-    sequences = search_calcyanin(
-        reference,
-        '-',     
-        glyx3.hmm,
-        gly1.hmm,
-        gly2.hmm,
-        gly3.hmm,
-        Z=Z,
-        domZ=domZ,    
-    )    
-    hits_2_features(
+def _hmm_digest(hmm):
+    """Digest of the parameters of a pyhmmer.plan7.HMM, whatever its creation time."""
+    digest = hashlib.sha256(hmm.name)
+    for values in (hmm.match_emissions,hmm.insert_emissions,hmm.transition_probabilities):
+        digest.update(np.asarray(values).tobytes())
+    digest.update(np.asarray(hmm.evalue_parameters.as_vector()).tobytes())
+    return digest.hexdigest()
+
+def thresholds_keys(reference,glyx3,gly1,gly2,gly3,Z,domZ):
+    """Keys of the GlyX3 and GlyZip thresholds families, see auto_thresholds(). Each family \
+    is keyed on the reference sequences, its own profile(s) and Z/domZ: GlyX3 thresholds on \
+    the GlyX3 profile, GlyZip ones on the Gly1, Gly2 and Gly3 profiles. GlyZip thresholds are \
+    calibrated on the reference sequences with a GlyX3 hit, the reference being the sequences \
+    the GlyX3 profile is built from, the GlyX3 profile is not part of the GlyZip key.
+
+    Args:
+        reference (str): Path to the fasta file of reference sequences.
+        glyx3, gly1, gly2, gly3 (Hmm): Hmm objects.
+        Z (int), domZ (int): See search_calcyanin().
+    Raises:
+        FileNotFoundError: If reference doesn't exist.
+    Return:
+        A tuple (glyx3 key, glyzip key).
+    """
+    # the trailing version must be bumped whenever the calibration changes.
+    common = [cache.file_digest(reference),str(Z),str(domZ),pyhmmer.__version__,"2"]
+    glyx3_key = hashlib.sha256("|".join(
+        ["GlyX3"] + common + [_hmm_digest(glyx3.hmm)]).encode()).hexdigest()
+    glyzip_key = hashlib.sha256("|".join(
+        ["GlyZip"] + common + [_hmm_digest(h.hmm) for h in (gly1,gly2,gly3)]).encode()).hexdigest()
+    return glyx3_key, glyzip_key
+
+def _read_thresholds(cache_file):
+    """Thresholds cache as a dict of family key -> thresholds, empty if it can't be read."""
+    calibrated = {}
+    try:
+        if os.path.exists(cache_file):
+            with open(cache_file) as fh:
+                calibrated = yaml.safe_load(fh)
+    except (OSError,yaml.YAMLError) as e:
+        logging.warning("Thresholds cache {} can't be read : {}".format(cache_file,e))
+    return calibrated if isinstance(calibrated,dict) else {}
+
+def _write_thresholds(cache_file,thresholds):
+    """Merge thresholds into the cache, under a lock so that concurrent runs keep each other's \
+    families. Families are kept in the order they were calibrated, the oldest ones are dropped \
+    beyond THRESHOLDS_CACHE_SIZE."""
+    try:
+        cache_dir = os.path.dirname(os.path.abspath(cache_file))
+        os.makedirs(cache_dir,exist_ok=True)
+        with cache.file_lock(cache_file):
+            calibrated = _read_thresholds(cache_file)
+            for key, value in thresholds.items():
+                calibrated.pop(key,None)
+                calibrated[key] = value
+            calibrated = dict(list(calibrated.items())[-THRESHOLDS_CACHE_SIZE:])
+            with tempfile.NamedTemporaryFile(mode="w",dir=cache_dir,delete=False) as tmp:
+                yaml.safe_dump(calibrated,tmp,sort_keys=False)
+            os.replace(tmp.name,cache_file)
+    except OSError as e:
+        logging.warning("Thresholds can't be cached : {}".format(e))
+
+def auto_thresholds(reference,glyx3,gly1,gly2,gly3,Z,domZ,cache_file=None):    
+    """Derive E-value and coverage thresholds from the hits of the reference sequences.
+
+    Args:
+        reference (str): Path to the fasta file of reference sequences, e.g the GlyX3 MSA.
+        glyx3, gly1, gly2, gly3 (Hmm): Hmm objects.
+        Z (int), domZ (int): See search_calcyanin().
+        cache_file (str): If set, thresholds are kept in this yaml file by family, see thresholds_keys(). \
+            Only the families missing from it are calibrated: the search of the reference sequences \
+            is skipped when both are known, e.g when a run starts from the same profiles as a previous \
+            one, and limited to GlyX3 when only the GlyX3 family is missing. Thresholds are calibrated \
+            again if the file can't be read, and not kept if it can't be written.
+    Raises:
+        FileNotFoundError: If reference doesn't exist.
+    Return:
+        A tuple (GlyX3 E-value, GlyX3 coverage, GlyZip E-value, GlyZip coverage).
+    """
+    keys = {}
+    known = {}
+    if cache_file:
+        keys = dict(zip(("GlyX3","GlyZip"),thresholds_keys(reference,glyx3,gly1,gly2,gly3,Z,domZ)))
+        calibrated = _read_thresholds(cache_file)
+        known = {family:(calibrated[key]["e-value"],calibrated[key]["coverage"])
+                 for family, key in keys.items() if key in calibrated}
+        if len(known) == 2:
+            logging.debug("Thresholds loaded from {}".format(cache_file))
+            return known["GlyX3"] + known["GlyZip"]
+
+    if "GlyZip" in known:
+        # GlyX3 thresholds only depend on the GlyX3 hits.
+        sequences = Sequences(reference)
+        sequences.hmmsearch([glyx3.hmm],Z=Z,domZ=domZ)
+    else:
+        # GlyZip ones are calibrated on the sequences with a GlyX3 hit.
+        sequences = search_calcyanin(
+            reference,
+            '-',     
+            glyx3.hmm,
+            gly1.hmm,
+            gly2.hmm,
+            gly3.hmm,
+            Z=Z,
+            domZ=domZ,    
+        )    
+    features_table = hits_2_feature_table(
         sequences,
         glyx3_evalue_threshold=1e-3,
         glyx3_coverage_threshold=0.5,
@@ -464,14 +891,128 @@ def auto_thresholds(reference,glyx3,gly1,gly2,gly3,Z,domZ):
         nter_coverage_threshold = 0, 
         nter_evalue_threshold = 1
     )
-    features_table = sequences.to_feature_table()
-    glyx3_evalue_threshold, glyx3_coverage_threshold = get_coverage_and_evalue_threshold(
-        features_table,['GlyX3_HMM_Profile'])
-    glyzip_evalue_threshold, glyzip_coverage_threshold = get_coverage_and_evalue_threshold(
-        features_table,['Gly1_HMM_Profile','Gly2_HMM_Profile','Gly3_HMM_Profile'])
+    thresholds = dict(known)
+    if "GlyX3" not in known:
+        thresholds["GlyX3"] = get_coverage_and_evalue_threshold(
+            features_table,['GlyX3_HMM_Profile'])
+    if "GlyZip" not in known:
+        thresholds["GlyZip"] = get_coverage_and_evalue_threshold(
+            features_table,['Gly1_HMM_Profile','Gly2_HMM_Profile','Gly3_HMM_Profile'])
+
+    if cache_file:
+        _write_thresholds(cache_file,{keys[family]:{"e-value":thresholds[family][0],"coverage":thresholds[family][1]}
+                                      for family in keys if family not in known})
+    return thresholds["GlyX3"] + thresholds["GlyZip"]
+
+
+def check_columnar_format(columnar):
+    """Check that a columnar format is known and that pyarrow is installed.
+
+    Args:
+        columnar (str): One of COLUMNAR_FORMATS, or None.
+    Raises:
+        ValueError: If columnar is unknown.
+        ImportError: If pyarrow is not installed.
+    Return:
+        None
+    """
+    if columnar is None:
+        return
+    if columnar not in COLUMNAR_FORMATS:
+        raise ValueError("Unknown columnar format {}, expect one of {}.".format(
+            columnar,", ".join(COLUMNAR_FORMATS)))
+    if importlib.util.find_spec("pyarrow") is None:
+        raise ImportError("{} output requires pyarrow, consider installing it using pip install pyarrow.".format(columnar))
+
+def write_table(df,filename,table,columnar=None):
+    """Write a table as TSV and, if requested, in a columnar format next to it. \
+    Columnar files keep column types and store the low cardinality columns of table \
+    as dictionary encoded categoricals, see CATEGORICAL_COLUMNS and NUMERIC_COLUMNS.
+
+    Args:
+        df (pd.DataFrame): Table indexed by sequence identifier.
+        filename (str): Path to the TSV file, e.g <res_dir>/pcalf.features.tsv.
+        table (str): Either "features", "hits" or "summary".
+        columnar (str): One of COLUMNAR_FORMATS, or None for TSV only.
+    Raises:
+        ValueError: If columnar is unknown.
+        ImportError: If pyarrow is not installed.
+    Return:
+        None
+    """
+    df.to_csv(filename,sep="\t",header=True,index=True)
+    if columnar is None:
+        return
+    check_columnar_format(columnar)
+    # feather only supports a default index, the identifier is kept as a column as in the TSV.
+    df = df.reset_index().infer_objects()
+    for column in NUMERIC_COLUMNS.get(table,[]):
+        df[column] = pd.to_numeric(df[column])
+    df = df.astype({c:"category" for c in CATEGORICAL_COLUMNS[table]})
+    path = os.path.splitext(filename)[0] + COLUMNAR_FORMATS[columnar]
+    if columnar == "parquet":
+        df.to_parquet(path,index=False)
+    else:
+        df.to_feather(path)
 
-    return (glyx3_evalue_threshold, glyx3_coverage_threshold, glyzip_evalue_threshold, glyzip_coverage_threshold)
+def read_table(filename):
+    """Read a table written by write_table(), from its columnar version if any.
+
+    Args:
+        filename (str): Path to the TSV file, e.g <res_dir>/pcalf.features.tsv.
+    Raises:
+        FileNotFoundError: If no version of the table exists.
+    Return:
+        pd.DataFrame indexed by sequence identifier.
+    """
+    root = os.path.splitext(filename)[0]
+    if importlib.util.find_spec("pyarrow") is not None:
+        if os.path.exists(root + COLUMNAR_FORMATS["parquet"]):
+            df = pd.read_parquet(root + COLUMNAR_FORMATS["parquet"])
+            return df.set_index(df.columns[0])
+        if os.path.exists(root + COLUMNAR_FORMATS["feather"]):
+            df = pd.read_feather(root + COLUMNAR_FORMATS["feather"])
+            return df.set_index(df.columns[0])
+    return pd.read_csv(filename,sep="\t",header=0,index_col=0)
 
+def summarize_features(features,sequences):
+    """Summarize a feature table, one row per sequence and src with its N-ter type, \
+    its C-ter layout (glycine zippers ordered by start) and its flag, see decision_tree_batch().
+
+    Args:
+        features (pd.DataFrame): Feature table, see Sequences.to_feature_table().
+        sequences (Sequences): Sequences of the feature table.
+    Raises:
+        ValueError: If a sequence of the feature table is not found.
+    Return:
+        pd.DataFrame indexed by sequence accession, sorted by sequence accession and src.
+    """
+    columns = ["sequence_accession","sequence_src","flag","nter","nter_neighbor","cter","sequence"]
+    if features.empty:
+        return pd.DataFrame(columns=columns).set_index("sequence_accession")
+    keys = ["sequence_id","sequence_src"]
+    table = features.reset_index()[keys + ["feature_id","feature_start","feature_src"]]
+    index = table.groupby(keys).size().index
+
+    # a stable sort keeps the original order of glycine zippers starting at the same position.
+    glyzips = table[table.feature_id.isin(["Gly1","Gly2","Gly3"])].sort_values("feature_start",kind="stable")
+    cter = glyzips.groupby(keys,sort=False).feature_id.agg(",".join).reindex(index).fillna("")
+    nter = table[table.feature_id == "N-ter"].groupby(keys,sort=False).feature_src.first().str.split("||",n=1,regex=False)
+    nter_type = nter.str[0].reindex(index)
+    nter_neighbor = nter.str[1].reindex(index)
+    nter_type = nter_type.astype(object).where(nter_type.notna(),None)
+    nter_neighbor = nter_neighbor.astype(object).where(nter_neighbor.notna(),None)
+
+    sequence_ids = index.get_level_values(0)
+    return pd.DataFrame({
+        "sequence_accession":sequence_ids,
+        "sequence_src":index.get_level_values(1),
+        "flag":decision_tree_batch(nter_type,cter).values,
+        "nter":nter_type.values,
+        "nter_neighbor":nter_neighbor.values,
+        "cter":cter.values,
+        "sequence":[str(sequences.get_seq_by_id(sid).seq) for sid in sequence_ids],
+    }).set_index("sequence_accession")
 
 def dump_iteration(
         res_dir,
@@ -480,8 +1021,24 @@ def dump_iteration(
         gly1,
         gly2,
         gly3,
-        nter
+        nter,
+        columnar=None,
         ):    
+    """Write profiles, MSAs, the N-ter DB and the features, hits and summary tables of an iteration.
+
+    Args:
+        res_dir (str): Output directory.
+        sequences (Sequences): Sequences with features.
+        glyx3, gly1, gly2, gly3 (Hmm): Hmm objects.
+        nter (dict): N-ter DB, see parse_nterdb().
+        columnar (str): If set, tables are also written in this columnar format, see write_table().
+    Raises:
+        ValueError: If columnar is unknown.
+        ImportError: If columnar is set and pyarrow is not installed.
+    Return:
+        None
+    """
+    check_columnar_format(columnar)
     logging.info("Dumping HMMs.") 
     hmmdir = os.path.join(res_dir,"HMM")
     os.makedirs(hmmdir,exist_ok=True)
@@ -505,46 +1062,14 @@ def dump_iteration(
 
     logging.info("Writing feature table.")
     features = sequences.to_feature_table()
-    features.to_csv(res_dir + "/pcalf.features.tsv",sep="\t",header=True,index=True)
+    write_table(features,res_dir + "/pcalf.features.tsv","features",columnar)
     logging.info("Writing hits table")
     hits = sequences.to_hits_table()
-    hits.to_csv(res_dir + "/pcalf.hits.tsv",sep="\t",header=True,index=True)
+    write_table(hits,res_dir + "/pcalf.hits.tsv","hits",columnar)
 
     logging.info("Making summary.")
-    summary_datas = []
-    for idx, seq_features_df in features.groupby(["sequence_id","sequence_src"]):
-        sequence = idx[0]
-        sequence_src = idx[1]
-        cterom = ",".join(
-                        list(
-                            seq_features_df[seq_features_df.feature_id.isin(["Gly1","Gly2","Gly3"]) ].sort_values("feature_start").feature_id
-                            )
-                )
-
-        nter_type = None
-        nter_neighbor = None 
-        if not seq_features_df[seq_features_df.feature_id == "N-ter" ].empty:
-            nter_type,nter_neighbor = "".join(set(
-                seq_features_df[seq_features_df.feature_id == "N-ter" ].feature_src
-            )).split("||")
-
-        summary_datas.append(
-            {
-                "sequence_accession":sequence,
-                "sequence_src": sequence_src,
-                "flag":decision_tree(nter_type,cterom),
-                "nter":nter_type,
-                "nter_neighbor": nter_neighbor,
-                "cter":cterom,
-                "sequence":str(sequences.get_seq_by_id(sequence).seq),
-                # "iteration":seq_per_iteration[sequence]
-            }
-        )
-    if summary_datas:
-        df = pd.DataFrame(summary_datas).set_index("sequence_accession")
-    else:
-        df = pd.DataFrame(columns=["sequence_accession","sequence_src","flag","nter","nter_neighbor","cter","sequence"]).set_index("sequence_accession")
-    df.to_csv(res_dir + "/pcalf.summary.tsv",sep="\t",index=True,header=True)
+    df = summarize_features(features,sequences)
+    write_table(df,res_dir + "/pcalf.summary.tsv","summary",columnar)
 
 
 
@@ -565,6 +1090,24 @@ def pcalf(
         nter_coverage_threshold:float = 0.80, 
         nter_evalue_threshold:float = 1e-4,
         is_update_iterative:bool=False,
+        fused_scan:bool=False,
+        threads:int=None,
+        jobs:int=None,
+        backend:str="thread",
+        batch_size:int=None,
+        identity:bool=True,
+        nter_method:str="blastp",
+        nter_blastdb:bool=False,
+        cache_dir:str=None,
+        batch_nter:bool=False,
+        candidates:dict=None,
+        sequence_cache:cache.SequenceCache=None,
+        update_batch_size:int=None,
+        update_max_rounds:int=None,
+        parallel_update:bool=False,
+        thresholds_cache:str=None,
+        profiler:profiling.Profiler=None,
+        checkpoint_dir:str=None,
         **kwargs
         ): 
     """Search for calcyanin within one or more fasta files using several HMM profiles and 'database' of known N-ter.
@@ -586,6 +1129,26 @@ def pcalf(
         glyzip_coverage_threshold (float): Coverage theshold for glycine zipper        
         max_iteration (int): Number of iteration 
         is_update_iterative (bool): Update hmm sequence by sequence.
+        fused_scan (bool): Search the four profiles in a single hmmsearch per file.
+        threads (int): Total number of threads.
+        jobs (int): Number of files searched concurrently.
+        backend (str): Concurrency backend, either "thread" or "process".
+        batch_size (int): Stream each file batch_size sequences at a time.
+        identity (bool): If False, identity of HMM hits is not computed.
+        nter_method (str): N-ter search method, either "blastp" or "phmmer".
+        nter_blastdb (bool): Search N-ter with blastp against a BLAST database kept in cache_dir \
+            instead of the N-ter fasta file, E-values then differ, see make_nter_blastdb().
+        cache_dir (str): Directory of data reused across runs, e.g N-ter BLAST databases.
+        batch_nter (bool): Search N-ter once for all GlyX3 positive sequences instead of file by file.
+        candidates (dict): Enable the incremental search, see search_calcyanin_concurrent(). \
+            Filled at the first iteration, then only candidates are searched again.
+        sequence_cache (cache.SequenceCache): Digitized sequences of fastas reused across iterations.
+        update_batch_size (int): Number of sequences aligned between two rebuilds of a profile, see update_hmm().
+        update_max_rounds (int): Maximum number of rebuilds of a profile, see update_hmm().
+        parallel_update (bool): Update the four profiles concurrently.
+        thresholds_cache (str): Yaml file where automatic thresholds are kept across runs, see auto_thresholds().
+        profiler (profiling.Profiler): If set, each stage is recorded, see profiling.Profiler.
+        checkpoint_dir (str): Directory where the result of each file is saved, see search_calcyanin_concurrent().
     Raises:
         TypeError if one sequence is not an instance of pyhmmer.easel.DigitalSequence.
     Return:
@@ -596,15 +1159,17 @@ def pcalf(
     reference_file = tempfile.NamedTemporaryFile(mode="w")    
     glyx3.dump(reference_file.name)    
     reference_file.flush()
-    auto_glyx3_e_value,auto_glyx3_cov,auto_glyzip_e_value,auto_glyzip_cov =  auto_thresholds(
-        reference_file.name,
-        glyx3,
-        gly1,
-        gly2,
-        gly3,
-        Z,
-        domZ
-    )
+    with profiling.stage(profiler,"thresholds"):
+        auto_glyx3_e_value,auto_glyx3_cov,auto_glyzip_e_value,auto_glyzip_cov =  auto_thresholds(
+            reference_file.name,
+            glyx3,
+            gly1,
+            gly2,
+            gly3,
+            Z,
+            domZ,
+            thresholds_cache
+        )
 
     glyx3_evalue_threshold    = glyx3_evalue_threshold    if glyx3_evalue_threshold    else auto_glyx3_e_value  
     glyx3_coverage_threshold  = glyx3_coverage_threshold  if glyx3_coverage_threshold  else auto_glyx3_cov
@@ -641,6 +1206,8 @@ def pcalf(
     for sid, nter in nterdb.items():
         nterfa.write(">{}||{}\n{}\n".format(nter[0],sid,nter[1]))
     nterfa.flush()
+    with profiling.stage(profiler,"nter_db",items=len(nterdb)):
+        nter_db = make_nter_blastdb(nterfa.name,cache_dir) if nter_method == "blastp" and nter_blastdb else None
     # search calcyanin        
     
     logging.info("Start search for {} files.".format(len(fastas)))    
@@ -652,64 +1219,72 @@ def pcalf(
             gly3,
             nterfa.name,
             Z,
-            domZ
+            domZ,
+            fused_scan,
+            threads,
+            jobs,
+            backend,
+            batch_size,
+            identity,
+            nter_method,
+            nter_db,
+            batch_nter,
+            candidates,
+            sequence_cache,
+            profiler,
+            checkpoint_dir
         )
     logging.info("Total number of sequences with at least one GlyX3 hit: {}".format(len(sequences.sequences)))    
 
     logging.info("Start features creation.")
-    sequences = hits_2_features(
-        sequences,
-        glyx3_evalue_threshold,  
-        glyx3_coverage_threshold,  
-        glyzip_evalue_threshold,
-        glyzip_coverage_threshold,
-        nter_coverage_threshold, 
-        nter_evalue_threshold) 
+    with profiling.stage(profiler,"features",items=len(sequences.sequences)):
+        sequences = hits_2_features(
+            sequences,
+            glyx3_evalue_threshold,  
+            glyx3_coverage_threshold,  
+            glyzip_evalue_threshold,
+            glyzip_coverage_threshold,
+            nter_coverage_threshold, 
+            nter_evalue_threshold) 
     
     new_calc = 0
     new_seq = 0
     valid_calcyanin = Sequences() 
     if sequences.sequences:            
         for seq in sequences.sequences:        
-            if seq.get_feature("GlyX3" ):
+            # features are read in place, get_feature() would copy them as Seq objects.
+            if any(f.id == "GlyX3" for f in seq.features):
                 new_seq += 1           
-                nter = ",".join([f.features[0].qualifiers["src"].split("|")[0] for f in  seq.get_feature("N-ter")])
-                cter = ",".join([f.features[0].id for f in seq.get_feature("Gly1" )+
-                                    seq.get_feature("Gly2" )+
-                                    seq.get_feature("Gly3" )])
+                nter = ",".join([f.qualifiers["src"].split("|")[0] for f in seq.features if f.id == "N-ter"])
+                cter = ",".join([f.id for fid in ("Gly1","Gly2","Gly3") for f in seq.features if f.id == fid])
                 flag = decision_tree(nter,cter)
                 seq.flag = flag
                 if flag == "Calcyanin with known N-ter" or flag == "Calcyanin with new N-ter":
                     new_calc += 1 
-                    valid_calcyanin.sequences.append(seq)
+                    valid_calcyanin.append(seq)
             
 
         logging.info("New sequences with a match against GlyX3 [+{}]".format(new_seq))                    
         logging.info("New calcyanin [+{}] ! :)".format(new_calc))                                    
         logging.info("Updating HMM profiles and N-ter DB.")        
-        glyx3features = valid_calcyanin.get_feature("GlyX3")
-        
-        if glyx3features:  
-            logging.info("Updating GlyX3")
-            glyx3 = update_hmm(glyx3features,glyx3,is_update_iterative)
-
-            
-        gly1features = valid_calcyanin.get_feature("Gly1")        
-        if gly1features:    
-            logging.info("Updating Gly1")
-            gly1 = update_hmm(gly1features,gly1,is_update_iterative)
-
-            
-        gly2features = valid_calcyanin.get_feature("Gly2")        
-        if gly2features:
-            logging.info("Updating Gly2")
-            gly2 = update_hmm(gly2features,gly2,is_update_iterative)
-
-            
-        gly3features = valid_calcyanin.get_feature("Gly3")        
-        if gly3features:
-            logging.info("Updating Gly3")
-            gly3 = update_hmm(gly1features,gly3,is_update_iterative)
+        profiles = {"GlyX3":glyx3,"Gly1":gly1,"Gly2":gly2,"Gly3":gly3}
+        features = {name:valid_calcyanin.get_feature(name) for name in profiles}
+        features = {name:f for name,f in features.items() if f}
+        def _update(name):
+            with profiling.stage(profiler,"update_hmm",items=len(features[name]),profile=name):
+                return update_hmm(features[name],profiles[name],is_update_iterative,
+                                  update_batch_size,update_max_rounds,profiler)
+        if parallel_update and len(features) > 1:
+            logging.info("Updating {}".format(",".join(features)))
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(features)) as executor:
+                futures = {name:executor.submit(_update,name) for name in features}
+                for name, future in futures.items():
+                    profiles[name] = future.result()
+        else:
+            for name in features:
+                logging.info("Updating {}".format(name))
+                profiles[name] = _update(name)
+        glyx3, gly1, gly2, gly3 = profiles["GlyX3"], profiles["Gly1"], profiles["Gly2"], profiles["Gly3"]
 
         nterfeatures = valid_calcyanin.get_feature("N-ter")
         if nterfeatures:                
@@ -731,6 +1306,77 @@ def pcalf(
           
 
 
+# Profiles files of an iteration directory, see dump_iteration().
+PROFILE_NAMES = ("Glyx3","Gly1","Gly2","Gly3")
+
+def mark_iteration(iteration_dir,iteration,glyx3,gly1,gly2,gly3,thresholds_by_ite):
+    """Mark an iteration directory written by dump_iteration() as complete, so that a run \
+    can be resumed from it, see load_iteration(). Profiles are also written in binary format \
+    next to the text ones, which are rounded.
+
+    Args:
+        iteration_dir (str): Directory written by dump_iteration().
+        iteration (int): Iteration number.
+        glyx3, gly1, gly2, gly3 (Hmm): Updated Hmm objects.
+        thresholds_by_ite (dict): Thresholds of each iteration so far.
+    Raises:
+        None
+    Return:
+        None
+    """
+    for name, profile in zip(PROFILE_NAMES,(glyx3,gly1,gly2,gly3)):
+        with open(os.path.join(iteration_dir,"HMM","{}.h3m".format(name)),"wb") as fh:
+            profile.hmm.write(fh,binary=True)
+    # the marker is written last.
+    tmp = os.path.join(iteration_dir,"checkpoint.yaml.tmp")
+    with open(tmp,"w") as fh:
+        yaml.safe_dump({"iteration":iteration,"thresholds":thresholds_by_ite},fh)
+    os.replace(tmp,os.path.join(iteration_dir,"checkpoint.yaml"))
+
+def last_iteration(res_dir):
+    """Find the complete iteration directories of a run, see mark_iteration().
+
+    Args:
+        res_dir (str): Output directory of run_pcalf().
+    Raises:
+        None
+    Return:
+        A dict {iteration (int): iteration directory (str)}.
+    """
+    iterations = {}
+    iterations_dir = os.path.join(res_dir,"iterations")
+    if os.path.isdir(iterations_dir):
+        for name in os.listdir(iterations_dir):
+            marker = os.path.join(iterations_dir,name,"checkpoint.yaml")
+            if name.startswith("iteration_") and os.path.exists(marker):
+                with open(marker) as fh:
+                    iterations[yaml.safe_load(fh)["iteration"]] = os.path.join(iterations_dir,name)
+    return iterations
+
+def load_iteration(iteration_dir):
+    """Load the profiles, N-ter DB and thresholds of a complete iteration directory.
+
+    Args:
+        iteration_dir (str): Directory marked by mark_iteration().
+    Raises:
+        FileNotFoundError: If the directory is not complete.
+    Return:
+        A tuple (iteration, glyx3, gly1, gly2, gly3, nterdb, thresholds_by_ite).
+    """
+    with open(os.path.join(iteration_dir,"checkpoint.yaml")) as fh:
+        state = yaml.safe_load(fh)
+    profiles = []
+    for name in PROFILE_NAMES:
+        with pyhmmer.plan7.HMMFile(os.path.join(iteration_dir,"HMM","{}.h3m".format(name))) as hmm_file:
+            hmm = hmm_file.read()
+        profile = Hmm(hmm.name.decode())
+        profile.msa_file = os.path.join(iteration_dir,"MSA","{}.msa.fa".format(name))
+        profile.msa = profile.load_msa(profile.msa_file,hmm.name.decode())
+        profile.hmm = hmm
+        profiles.append(profile)
+    nterdb = parse_nterdb(os.path.join(iteration_dir,"N-ter-DB.tsv"))
+    return (state["iteration"], *profiles, nterdb, state["thresholds"])
+
 def run_pcalf(*args,**kwargs):
     ite = 0
     thresholds_by_ite = {} 
@@ -739,57 +1385,123 @@ def run_pcalf(*args,**kwargs):
     logging.info('Iterative search enable [max-iteration: {}]'.format(max_ite))
     keep_going = True
     fastas,names,glyx3,gly1,gly2,gly3,nterdb = args
+    resume = kwargs.pop('resume',False)
+    checkpoint_dir = os.path.join(res_dir,'checkpoints') if kwargs.pop('checkpoint',False) or resume else None
+    if resume:
+        iterations = last_iteration(res_dir)
+        if iterations:
+            last = max(iterations)
+            # sequences of an iteration are not kept, the last one is done again (from the
+            # results of each file, if any) to write the final results.
+            start = last - 1 if last + 1 == max_ite else last
+            if start in iterations:
+                start, glyx3, gly1, gly2, gly3, nterdb, thresholds_by_ite = load_iteration(iterations[start])
+                ite = start + 1
+        logging.info('Resume from iteration {} [last complete iteration: {}].'.format(
+            ite,max(iterations) if iterations else None))
     glyx3_initial_size = glyx3.hmm.nseq
+    candidates_file = os.path.join(checkpoint_dir,'candidates.pkl') if checkpoint_dir else None
+    if kwargs.pop('incremental',False):
+        # Sequences without any hit against the first profiles are not searched again.
+        if kwargs.get('Z') is None or kwargs.get('domZ') is None:
+            logging.warning("Z and domZ are not set, E-values of the incremental search will depend on the number of candidates.")
+        logging.info('Incremental search enable, next iterations only search candidates of the first one.')
+        kwargs['candidates'] = {}
+        if ite > 0:
+            if candidates_file and os.path.exists(candidates_file):
+                with open(candidates_file,'rb') as fh:
+                    kwargs['candidates'] = pickle.load(fh)
+            else:
+                logging.warning("Candidates of the first iteration are lost, they are collected again.")
+    kwargs.setdefault('thresholds_cache',os.path.join(kwargs.get('cache_dir') or cache.default_cache_dir(),'thresholds.yaml'))
+    profiler = kwargs.get('profiler')
+    columnar = kwargs.pop('columnar',None)
+    check_columnar_format(columnar)
+    cache_memory = kwargs.pop('cache_memory',None)
+    if kwargs.pop('cache_sequences',False):
+        logging.info('Digitized sequences kept across iterations [memory budget: {} MB].'.format(cache_memory))
+        kwargs['sequence_cache'] = cache.SequenceCache(
+            max_bytes=int(cache_memory*1024**2) if cache_memory else None)
     
-    while keep_going:        
-        keep_going = False
-        # do 
-        ite_seqs, glyx3 , gly1, gly2, gly3 , nterdb , thresholds  = pcalf(
-            fastas,names,glyx3,gly1,gly2,gly3,nterdb,**kwargs)
-        thresholds_by_ite["iteration_{}".format(ite)] = thresholds
-        if glyx3.hmm.nseq > glyx3_initial_size:
-            keep_going = True
-            glyx3_initial_size = glyx3.hmm.nseq
-            dump_iteration(os.path.join(res_dir,'iterations','iteration_{}'.format(ite)),                
-                ite_seqs,
-                glyx3,
-                gly1,
-                gly2,
-                gly3,
-                nterdb
-            )
-
-        ite+=1
-        logging.info('{}/{} iterations done.'.format(ite,max_ite))
-        if ite==max_ite:
+    try:
+        while keep_going:        
             keep_going = False
+            if profiler is not None:
+                profiler.iteration = ite
+            if checkpoint_dir:
+                kwargs['checkpoint_dir'] = os.path.join(checkpoint_dir,'iteration_{}'.format(ite))
+            # do 
+            ite_seqs, glyx3 , gly1, gly2, gly3 , nterdb , thresholds  = pcalf(
+                fastas,names,glyx3,gly1,gly2,gly3,nterdb,**kwargs)
+            thresholds_by_ite["iteration_{}".format(ite)] = thresholds
+            if candidates_file and kwargs.get('candidates') and not os.path.exists(candidates_file):
+                _write_checkpoint(kwargs['candidates'],candidates_file)
+            if glyx3.hmm.nseq > glyx3_initial_size:
+                keep_going = True
+                glyx3_initial_size = glyx3.hmm.nseq
+                iteration_dir = os.path.join(res_dir,'iterations','iteration_{}'.format(ite))
+                with profiling.stage(profiler,"dump",items=len(ite_seqs.sequences)):
+                    dump_iteration(iteration_dir,                
+                        ite_seqs,
+                        glyx3,
+                        gly1,
+                        gly2,
+                        gly3,
+                        nterdb,
+                        columnar
+                    )
+                mark_iteration(iteration_dir,ite,glyx3,gly1,gly2,gly3,thresholds_by_ite)
+
+            ite+=1
+            logging.info('{}/{} iterations done.'.format(ite,max_ite))
+            if ite==max_ite:
+                keep_going = False
+    finally:
+        # spilled blocks are removed even if an iteration fails.
+        if kwargs.get('sequence_cache') is not None:
+            kwargs['sequence_cache'].close()
     logging.info('Converged (i.e , no new sequence detected) in {} iterations [max-iteration: {}]'.format(ite,max_ite))
-    dump_iteration(
-        res_dir, 
-        ite_seqs,
-        glyx3,
-        gly1,
-        gly2,
-        gly3,
-        nterdb
-    )
+    with profiling.stage(profiler,"dump",items=len(ite_seqs.sequences)):
+        dump_iteration(
+            res_dir, 
+            ite_seqs,
+            glyx3,
+            gly1,
+            gly2,
+            gly3,
+            nterdb,
+            columnar
+        )
     logging.info('Last iteration results saved under {}'.format(res_dir))
     thresholds_file_path = os.path.join(res_dir,'thresholds.yaml')
     yaml.dump(thresholds_by_ite,open(thresholds_file_path ,'w') )
     logging.info('Thresholds used for each iteration stored at : {}'.format(thresholds_file_path))
+    if profiler is not None:
+        profiler.dump(os.path.join(res_dir,'profile.json'))
+    if checkpoint_dir:
+        # the run is over, results of each file are not needed anymore.
+        shutil.rmtree(checkpoint_dir,ignore_errors=True)
     return ite_seqs, glyx3 , gly1, gly2, gly3 , nterdb
 
+# N-ter types and C-ter layouts used by decision_tree().
+KNOWN_NTER_TYPES = frozenset(["CoBaHMA-type","Y-type","X-type","Z-type"])
+_TYPICAL_CTER = re.compile("Gly1,Gly2,Gly3")
+_Y_TYPE_CTER = re.compile("Gly1,Gly3")
+_ANY_GLYZIP = re.compile("Gly(1|2|3)")
+
+@functools.lru_cache(maxsize=4096)
 def decision_tree(nter , cter):
-    """give a flag to a calcyanin based on its C-ter modular organization and its N-ter."""
-    if re.search("Gly1,Gly2,Gly3",cter):
-        if nter in ["CoBaHMA-type","Y-type","X-type","Z-type"]:
+    """give a flag to a calcyanin based on its C-ter modular organization and its N-ter. \
+    Flags only depend on a small set of (N-ter, C-ter) pairs, they are memoized."""
+    if _TYPICAL_CTER.search(cter):
+        if nter in KNOWN_NTER_TYPES:
             flag = "Calcyanin with known N-ter"
         else:
             flag = "Calcyanin with new N-ter"
-    elif re.search("Gly1,Gly3",cter) and nter == "Y-type":
+    elif nter == "Y-type" and _Y_TYPE_CTER.search(cter):
         flag = "Calcyanin with known N-ter"
-    elif re.search ("Gly(1|2|3)",cter):
-        if nter in ["CoBaHMA-type","Y-type","X-type","Z-type"]:
+    elif _ANY_GLYZIP.search(cter):
+        if nter in KNOWN_NTER_TYPES:
             flag = "Atypical Gly region with known N-ter"
         else:
             flag = "Atypical Gly region with new N-ter"
@@ -797,6 +1509,29 @@ def decision_tree(nter , cter):
         flag="Ancestral gly containing protein"
     return flag
 
+def decision_tree_batch(nter,cter):
+    """Flag many sequences at once, see decision_tree(). Each distinct (N-ter, C-ter) pair \
+    is classified once and flags are broadcast back to the rows.
+
+    Args:
+        nter (pd.Series): N-ter type of each sequence, missing values for sequences without N-ter.
+        cter (pd.Series): C-ter layout of each sequence, e.g "Gly1,Gly2,Gly3".
+    Raises:
+        None
+    Return:
+        pd.Series of flags, with the index of nter.
+    """
+    nter = pd.Series(nter,dtype=object)
+    pairs = pd.DataFrame({
+        "nter":nter.where(nter.notna(),None).values,
+        "cter":pd.Series(cter,dtype=object).values})
+    groups = pairs.groupby(["nter","cter"],dropna=False,sort=False)
+    # groups are numbered in order of first appearance, as returned by head(1).
+    codes = groups.ngroup().to_numpy()
+    flags = np.array([decision_tree(None if pd.isna(n) else n,c)
+                      for n,c in groups.head(1).itertuples(index=False)],dtype=object)
+    return pd.Series(flags[codes] if len(codes) else [],index=nter.index,dtype=object)
+
 def parse_nterdb(nterdb):   
     """parse the nterdb file to dictionnary"""
     nter_dict={} 
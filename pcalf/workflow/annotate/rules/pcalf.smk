@@ -2,6 +2,7 @@ import yaml
 import gzip
 import pandas  as pd
 from Bio import SeqIO
+from pcalf.core import search
 
 rule target_pcalf:     
     output:
@@ -75,7 +76,7 @@ rule pm_CCYA:
 
         with open(str(output),'w') as streamout:
             streamout.write("sequence_id\tccyA_genomic_region\tccyA_start\tccyA_stop\tccyA_frame\tccyA_partial\tccyA_pseudo\tccyA_src\tccyA_seq\n")
-            df = pd.read_csv(str(input[0]),sep="\t",header=0,index_col=0)
+            df = search.read_table(str(input[0]))
             for seqid, row in df.iterrows():
                 gid = row.sequence_src
                 cds_file = str(files[gid])
@@ -182,6 +183,7 @@ rule pm_PCALF:
         iterative_update = '--iterative-update' if config["config-ccya"]['iterative-update'] else '',
         Z = "-Z {}".format(config["config-ccya"]["Z"]) if config["config-ccya"]["Z"] else "",
         domZ = "--domZ {}".format(config["config-ccya"]["domZ"]) if config["config-ccya"]["domZ"] else "",
+        columnar = "--columnar {}".format(config["config-ccya"]["columnar"]) if config["config-ccya"].get("columnar") else "",
     log:
         os.path.join(RESDIR , "logs" , "pcalf.log"),
     resources:        
@@ -208,6 +210,7 @@ rule pm_PCALF:
         "--max-iteration {params.maxite} "
         "{params.Z} "
         "{params.domZ} " 
+        "{params.columnar} "
     
 def get_cds(wildcards):
     cds = []
@@ -31,6 +31,10 @@ setup(
          "plotly==5.11.0",
          "python-igraph==0.10.4",
     ],
+    extras_require={
+        # Parquet and Arrow IPC outputs, see pcalf --columnar.
+        "columnar":["pyarrow>=8"],
+    },
     python_requires = ">=3.9",
     packages = find_packages(),
     # package_dir = {"": "pcalf"},
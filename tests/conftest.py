@@ -0,0 +1,53 @@
+import os
+import sys
+import json
+
+import pytest
+
+BLASTP_STUB = '''#!{python}
+import sys, json
+args = sys.argv[1:]
+with open({calls!r},"a") as fh:
+    fh.write(json.dumps(["blastp"] + args) + "\\n")
+records = []
+for line in open(args[args.index("-query") + 1]):
+    line = line.strip()
+    if line.startswith(">"):
+        records.append([line[1:].split()[0],""])
+    elif line:
+        records[-1][1] += line
+# one full length hit per query, as if each query was in the subjects.
+for qacc, sequence in records:
+    n = len(sequence)
+    print("{{0}},X-type||stub,100.0,{{1}},0,0,1,{{1}},1,{{1}},1e-30,50,{{1}}".format(qacc,n))
+'''
+
+MAKEBLASTDB_STUB = '''#!{python}
+import sys, json
+with open({calls!r},"a") as fh:
+    fh.write(json.dumps(["makeblastdb"] + sys.argv[1:]) + "\\n")
+'''
+
+
+@pytest.fixture
+def blast_stubs(tmp_path,monkeypatch):
+    """blastp and makeblastdb stubs put first in PATH, each call is recorded. blastp reports \
+    one full length hit per query.
+
+    Returns a function listing the recorded calls, as lists of arguments.
+    """
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    calls = str(tmp_path / "calls.jsonl")
+    for name, stub in (("blastp",BLASTP_STUB),("makeblastdb",MAKEBLASTDB_STUB)):
+        path = bindir / name
+        path.write_text(stub.format(python=sys.executable,calls=calls))
+        path.chmod(0o755)
+    monkeypatch.setenv("PATH",str(bindir) + os.pathsep + os.environ.get("PATH",""))
+
+    def recorded():
+        if not os.path.exists(calls):
+            return []
+        with open(calls) as fh:
+            return [json.loads(line) for line in fh]
+    return recorded
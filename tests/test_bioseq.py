@@ -0,0 +1,147 @@
+import os
+import gzip
+
+import pytest
+import pyhmmer
+import numpy as np
+
+from pcalf.core.bioseq import Sequences, Seq, Hit, HitTable
+
+DATAS = os.path.join(os.path.dirname(__file__),"..","pcalf","datas")
+
+
+def load_hmms():
+    hmms = []
+    for name in ["GlyX3","Gly1","Gly2","Gly3"]:
+        with pyhmmer.plan7.HMMFile(os.path.join(DATAS,name + ".hmm")) as fh:
+            hmms.append(fh.read())
+    return hmms
+
+
+@pytest.fixture(scope="module")
+def searched():
+    sequences = Sequences(os.path.join(DATAS,"calcyanin.fasta"),src="calcyanin")
+    sequences.hmmsearch(load_hmms(),cpus=1,Z=10000,domZ=10000)
+    return sequences
+
+
+def hits_rows(sequences):
+    """Rows of the hits table built one Seq.hits at a time."""
+    return [(seq.id,seq.src,hit.target_len,hit.start_location,hit.stop_location,hit.score,
+             hit.identity,hit.coverage,hit.method,hit.src)
+            for seq in sequences.sequences for hit in seq.hits]
+
+
+def table_rows(table):
+    return [tuple(row) for row in table.reset_index().itertuples(index=False)]
+
+
+def test_hits_table_matches_seq_hits(searched):
+    table = searched.to_hits_table()
+    assert len(table) == sum(len(seq.hits) for seq in searched.sequences) > 0
+    assert table_rows(table) == hits_rows(searched)
+
+
+def test_hits_table_follows_sequences_setter(searched):
+    subset = Sequences()
+    subset.sequences = searched.sequences[:3]
+    assert len(subset.to_hits_table()) == sum(len(seq.hits) for seq in searched.sequences[:3]) > 0
+    assert table_rows(subset.to_hits_table()) == hits_rows(subset)
+
+
+def test_hits_table_follows_addhit(searched):
+    sequences = Sequences()
+    sequences.sequences = [Seq(seq,src=seq.src) for seq in searched.sequences[:2]]
+    for seq, ref in zip(sequences.sequences,searched.sequences[:2]):
+        seq.hits = list(ref.hits)
+    n_hits = len(sequences.to_hits_table())
+    sequences.sequences[0].addhit(Hit("manual",10,1,5,1e-10,90.0,0.4,"blastp","manual"))
+    table = sequences.to_hits_table()
+    assert len(table) == n_hits + 1
+    assert "manual" in set(table.hit_src)
+    assert table_rows(table) == hits_rows(sequences)
+
+
+def test_get_seq_by_id_follows_in_place_changes(searched):
+    sequences = Sequences()
+    sequences.sequences = list(searched.sequences[:3])
+    first, second = sequences.sequences[0], sequences.sequences[1]
+    assert sequences.get_seq_by_id(first.id) is first
+    # replaced in place, same number of sequences.
+    replacement = Seq(first,src="replacement")
+    sequences.sequences[0] = replacement
+    assert sequences.get_seq_by_id(first.id) is replacement
+    sequences.sequences[1] = searched.sequences[3]
+    assert sequences.get_seq_by_id(searched.sequences[3].id) is searched.sequences[3]
+    with pytest.raises(ValueError):
+        sequences.get_seq_by_id(second.id)
+    sequences.sequences.reverse()
+    sequences.sequences.append(Seq(first,src="duplicate"))
+    assert sequences.get_seq_by_id(first.id) is replacement
+
+
+def search_calcyanin_fasta():
+    sequences = Sequences(os.path.join(DATAS,"calcyanin.fasta"),src="calcyanin")
+    sequences.hmmsearch(load_hmms(),cpus=1,Z=10000,domZ=10000)
+    return sequences
+
+
+def test_hits_are_stored_in_a_hit_table():
+    sequences = search_calcyanin_fasta()
+    table = sequences.hit_table
+    # one search, one table holding the hits of all sequences in order.
+    assert sequences.hit_table is table
+    assert sequences.hit_counts().sum() == len(table) > 0
+    assert [row[2:] for row in hits_rows(sequences)] == list(zip(*(table.arrays[c].tolist() for c in HitTable.columns[1:])))
+    # Hit objects created on request are the reference afterwards.
+    sequences.sequences[0].hits.pop(0)
+    assert sequences.hit_counts().sum() == len(sequences.hit_table) == len(table) - 1
+
+
+def test_sort_hits_and_filter_by_hit():
+    sequences = search_calcyanin_fasta()
+    sequences.sequences.append(Seq(sequences.sequences[0],src="no hit"))
+    sequences.sequences[1].hits = [h for h in sequences.sequences[1].hits if h.hid != "GlyX3"]
+    expected = [(seq.id,sorted(seq.hits,key=lambda h: h.score)) for seq in sequences.sequences
+                if any(h.hid == "GlyX3" for h in seq.hits)]
+    sequences.filter_by_hit("GlyX3")
+    sequences.sort_hits()
+    assert len(sequences.sequences) == len(expected) > 0
+    table = sequences.hit_table
+    assert sequences.hit_table is table
+    hits_table = sequences.to_hits_table()
+    assert np.shares_memory(hits_table.hit_start.to_numpy(),table.arrays["start_location"])
+    assert [(seq.id,[(h.hid,h.start_location,h.score) for h in seq.hits]) for seq in sequences.sequences] == \
+        [(sid,[(h.hid,h.start_location,h.score) for h in hits]) for sid, hits in expected]
+
+
+def test_blastp_hits_go_to_their_query_on_shared_ids(blast_stubs):
+    # same identifier in two sources, the stub reports the length of the query as target_len.
+    sequences = Sequences.from_records([("ccyA","from a","MKVLAAGIVG"),("other","","MKVL")],src="a")
+    sequences.merge(Sequences.from_records([("ccyA","from b","MKVLAAGIVGLLAAT")],src="b"))
+    sequences.blastp("nter.fa")
+    assert len(blast_stubs()) == 1
+    assert [(seq.id,seq.src,[hit.target_len for hit in seq.hits]) for seq in sequences.sequences] == [
+        ("ccyA","a",[10]),("other","a",[4]),("ccyA","b",[15])]
+
+
+def test_iter_batches_matches_parsed_sequences(searched,tmp_path):
+    fasta = os.path.join(DATAS,"calcyanin.fasta")
+    parsed = Sequences(fasta,src="calcyanin")
+    # a long sequence and a gzip file go through the same filters.
+    gz = str(tmp_path / "calcyanin.fasta.gz")
+    with open(fasta,"rb") as fh, gzip.open(gz,"wb") as out:
+        out.write(fh.read() + b">too_long\n" + b"M"*10000 + b"\n")
+    for path in (fasta,gz):
+        batches = list(Sequences.iter_batches(path,src="calcyanin",batch_size=7))
+        assert [batch.count() for batch in batches[:-1]] == [7]*(len(batches)-1)
+        assert sum(batch.count() for batch in batches) == len(parsed.sequences)
+        assert [dseq.name.decode() for batch in batches for dseq in batch._digital] == [seq.id for seq in parsed.sequences]
+        merged = Sequences()
+        for batch in batches:
+            assert batch.sequences == []
+            batch.hmmsearch(load_hmms(),cpus=1,Z=10000,domZ=10000)
+            merged.merge(batch)
+        assert [(seq.id,seq.description,str(seq.seq)) for seq in merged.sequences] == \
+            [(seq.id,seq.description,str(seq.seq)) for seq in searched.sequences]
+        assert table_rows(merged.to_hits_table()) == table_rows(searched.to_hits_table())
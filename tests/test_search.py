@@ -0,0 +1,343 @@
+import os
+import re
+import copy
+import logging
+from shutil import which
+
+import pytest
+import yaml
+import numpy as np
+import pandas as pd
+
+from pcalf.core import search
+from pcalf.core.bioseq import Sequences
+
+from test_bioseq import DATAS, load_hmms
+
+THRESHOLDS = [
+    (1e-30,0.3,1e-5,0.7,0.8,1e-7),
+    (1e-3,0.5,1e-3,0.5,0,1),
+    (1e-10,0.1,1e-2,0.2,0.5,1e-3),
+    (1,0,1,0,0,10),
+    (1e-50,0.9,1e-20,0.9,0.9,1e-30),
+]
+
+
+def reference_feature_rows(seq,
+                           glyx3_evalue_threshold,
+                           glyx3_coverage_threshold,
+                           glyzip_evalue_threshold,
+                           glyzip_coverage_threshold,
+                           nter_coverage_threshold,
+                           nter_evalue_threshold):
+    """Features of one sequence computed residue by residue, as the per sequence functions \
+    of the first releases did, rows of Sequences.to_feature_table()."""
+    rows = []
+    def add(start,end,fid,identity,coverage,score,src,src_len):
+        rows.append((seq.id,seq.src,"domain",start,end,fid,identity,coverage,score,src,src_len,str(seq.seq[start:end])))
+
+    glyx3 = [h for h in seq.hits if h.score <= glyx3_evalue_threshold and h.hid == "Glyx3"]
+    if glyx3:
+        start = min(h.start_location for h in glyx3)
+        end = max(h.stop_location for h in glyx3)
+        coverage = (end-start)/glyx3[0].target_len
+        if coverage >= glyx3_coverage_threshold:
+            add(start,end,"GlyX3",min(str(h.identity) for h in glyx3),coverage,
+                min("{:.2e}".format(h.score) for h in glyx3),"GlyX3_HMM_Profile",glyx3[0].target_len)
+
+    seq.per_residue_annotation()
+    current, fraglen, fragments = None, 0, []
+    for _, hits in seq.res.items():
+        # residues without any hit are skipped, residues with other hits only end a fragment.
+        if hits:
+            hits = [h for h in hits if h.hid in ["Gly1","Gly2","Gly3"]]
+            if hits:
+                if hits[0].score <= glyzip_evalue_threshold:
+                    if current and current.hid == hits[0].hid:
+                        fraglen += 1
+                        continue
+                    if current:
+                        fragments.append((current,fraglen+1))
+                    current, fraglen = hits[0], 0
+            else:
+                if current:
+                    fragments.append((current,fraglen+1))
+                current = None
+    if current:
+        fragments.append((current,fraglen+1))
+    for hit, fraglen in fragments:
+        if fraglen/hit.target_len >= glyzip_coverage_threshold and hit.score:
+            add(hit.start_location,hit.stop_location,hit.hid,hit.identity,hit.coverage,
+                "{:.2e}".format(hit.score),"{}_HMM_Profile".format(hit.hid),hit.target_len)
+
+    self_match, valid_match = None, []
+    for hit in seq.hits:
+        if hit.method in search.NTER_METHODS and hit.score < nter_evalue_threshold and \
+            hit.coverage >= nter_coverage_threshold:
+            if hit.hid.split("||")[-1] == seq.id:
+                self_match = hit
+            else:
+                valid_match.append(hit)
+    nter = valid_match[0] if valid_match else self_match
+    if nter:
+        add(nter.start_location,nter.stop_location,"N-ter",nter.identity,nter.coverage,
+            nter.score,nter.hid,nter.target_len)
+    return rows
+
+
+@pytest.fixture(scope="module")
+def nter_fa(tmp_path_factory):
+    filename = tmp_path_factory.mktemp("nter") / "nterdb.fasta"
+    with open(filename,"w") as fh:
+        for sid, (ntype, nseq) in search.parse_nterdb(os.path.join(DATAS,"nterdb.ref.tsv")).items():
+            fh.write(">{}||{}\n{}\n".format(ntype,sid,nseq))
+    return str(filename)
+
+
+@pytest.fixture(scope="module")
+def searched(nter_fa):
+    sequences = Sequences(os.path.join(DATAS,"calcyanin.fasta"),src="calcyanin")
+    sequences.hmmsearch(load_hmms(),cpus=1,Z=10000,domZ=10000)
+    sequences.phmmer(search.load_nter_targets(nter_fa),cpus=1)
+    return sequences
+
+
+def table_rows(table):
+    return [tuple(row) for row in table.reset_index().itertuples(index=False)]
+
+
+@pytest.mark.parametrize("thresholds",THRESHOLDS)
+def test_feature_table_parity(searched,thresholds):
+    reference = copy.deepcopy(searched)
+    expected = [row for seq in reference.sequences for row in reference_feature_rows(seq,*thresholds)]
+    assert expected
+
+    table = search.hits_2_feature_table(copy.deepcopy(searched),*thresholds)
+    assert table_rows(table) == expected
+
+    sequences = search.hits_2_features(copy.deepcopy(searched),*thresholds)
+    assert table_rows(sequences.to_feature_table()) == expected
+    assert table.to_csv(sep="\t") == sequences.to_feature_table().to_csv(sep="\t")
+
+
+def test_hits_2_features_sorts_hits_by_score(searched):
+    sequences = search.hits_2_features(copy.deepcopy(searched),*THRESHOLDS[0])
+    for seq in sequences.sequences:
+        assert [h.score for h in seq.hits] == sorted(h.score for h in seq.hits)
+
+
+@pytest.mark.skipif(which("blastp") is None or which("makeblastdb") is None,reason="BLAST+ is not installed")
+def test_nter_blastdb_keeps_nter_features(nter_fa,tmp_path):
+    # E-values against the database are computed over the whole database, N-ter features \
+    # of the known calcyanins must not depend on it.
+    db = search.make_nter_blastdb(nter_fa,str(tmp_path))
+    assert db is not None
+    tables = []
+    for kwargs in ({},{"db":db}):
+        sequences = Sequences(os.path.join(DATAS,"calcyanin.fasta"),src="calcyanin")
+        sequences.blastp(nter_fa,**kwargs)
+        table = search.hits_2_feature_table(sequences).reset_index()
+        tables.append(table[table.feature_id == "N-ter"][["sequence_id","feature_src"]].values.tolist())
+    assert tables[0]
+    assert tables[0] == tables[1]
+
+
+def test_nter_blastdb_unwritable_cache_dir(nter_fa,tmp_path,monkeypatch):
+    monkeypatch.setattr(search,"which",lambda name: "/bin/true")
+    not_a_directory = tmp_path / "file"
+    not_a_directory.write_text("")
+    assert search.make_nter_blastdb(nter_fa,str(not_a_directory / "cache")) is None
+
+
+def test_read_table_falls_back_to_tsv(searched,tmp_path):
+    table = search.hits_2_feature_table(copy.deepcopy(searched),*THRESHOLDS[0])
+    filename = str(tmp_path / "pcalf.features.tsv")
+    search.write_table(table,filename,"features")
+    pd.testing.assert_frame_equal(search.read_table(filename),pd.read_csv(filename,sep="\t",header=0,index_col=0))
+    assert search.read_table(filename).reset_index().columns.tolist() == table.reset_index().columns.tolist()
+
+
+@pytest.mark.parametrize("nter_blastdb",[False,True])
+def test_pcalf_nter_blastdb_is_opt_in(blast_stubs,tmp_path,nter_blastdb):
+    profiles = [search.load_weighted_hmm(name,os.path.join(DATAS,msa),0.2,str(tmp_path / "cache"))
+                for name, msa in [("Glyx3","GlyX3.msa.fa"),("Gly1","Gly1.msa.fa"),("Gly2","Gly2.msa.fa"),("Gly3","Gly3.msa.fa")]]
+    sequences = search.pcalf([os.path.join(DATAS,"calcyanin.fasta")],["calcyanin"],*profiles,
+                             search.parse_nterdb(os.path.join(DATAS,"nterdb.ref.tsv")),
+                             threads=1,nter_blastdb=nter_blastdb,cache_dir=str(tmp_path / "cache"))[0]
+    calls = blast_stubs()
+    blastp = [call for call in calls if call[0] == "blastp"]
+    assert blastp
+    assert any(hit.method == "blastp" for seq in sequences.sequences for hit in seq.hits)
+    if nter_blastdb:
+        assert [call[0] for call in calls].count("makeblastdb") == 1
+        assert all("-db" in call and "-subject" not in call for call in blastp)
+    else:
+        assert "makeblastdb" not in [call[0] for call in calls]
+        assert all("-subject" in call and "-db" not in call for call in blastp)
+
+
+def test_blastp_passes_paths_without_shell(blast_stubs,nter_fa,tmp_path):
+    cache_dir = tmp_path / "my cache; touch injected"
+    db = search.make_nter_blastdb(nter_fa,str(cache_dir))
+    assert db.startswith(str(cache_dir))
+    Sequences(os.path.join(DATAS,"calcyanin.fasta"),src="calcyanin").blastp(nter_fa,db=db)
+    blastp = blast_stubs()[-1]
+    assert blastp[blastp.index("-db") + 1] == db
+    assert blastp[blastp.index("-outfmt") + 1].startswith("10 qacc stitle")
+    assert not os.path.exists("injected") and not (tmp_path / "injected").exists()
+
+
+def test_run_pcalf_closes_the_sequence_cache_on_failure(tmp_path,monkeypatch):
+    closed = []
+    monkeypatch.setattr(search.cache.SequenceCache,"close",lambda self: closed.append(self))
+    def failing_pcalf(*args,**kwargs):
+        raise RuntimeError("iteration failed")
+    monkeypatch.setattr(search,"pcalf",failing_pcalf)
+    glyx3 = search.load_weighted_hmm("Glyx3",os.path.join(DATAS,"GlyX3.msa.fa"),0.2,str(tmp_path))
+    with pytest.raises(RuntimeError):
+        search.run_pcalf([],[],glyx3,None,None,None,{},max_iteration=2,res_dir=str(tmp_path),
+                         cache_dir=str(tmp_path),cache_sequences=True)
+    assert len(closed) == 1
+
+
+def test_pcalf_updates_each_profile_with_its_own_features(tmp_path,monkeypatch):
+    # the first releases updated the Gly3 profile with the Gly1 features.
+    profiles = {name:search.load_weighted_hmm(name.capitalize(),os.path.join(DATAS,msa),0.2,str(tmp_path))
+                for name, msa in [("GlyX3","GlyX3.msa.fa"),("Gly1","Gly1.msa.fa"),("Gly2","Gly2.msa.fa"),("Gly3","Gly3.msa.fa")]}
+    updated = {}
+    def recording_update_hmm(l_seq,hmm,*args,**kwargs):
+        name = next(name for name, profile in profiles.items() if profile is hmm)
+        updated[name] = {f.features[0].id for f in l_seq}
+        return hmm
+    monkeypatch.setattr(search,"update_hmm",recording_update_hmm)
+    search.pcalf([os.path.join(DATAS,"calcyanin.fasta")],["calcyanin"],*profiles.values(),
+                 search.parse_nterdb(os.path.join(DATAS,"nterdb.ref.tsv")),
+                 threads=1,nter_method="phmmer",cache_dir=str(tmp_path))
+    assert updated == {name:{name} for name in profiles}
+
+
+def test_hmmalign_members_are_built_on_request(tmp_path,caplog):
+    gly1 = search.load_weighted_hmm("Gly1",os.path.join(DATAS,"Gly1.msa.fa"),0.2,str(tmp_path))
+    new = Sequences(os.path.join(DATAS,"calcyanin.fasta"),src="calcyanin").sequences[:3]
+    updated = gly1.hmmalign([seq.digitize() for seq in new])
+    assert updated._members is None
+    with caplog.at_level(logging.DEBUG):
+        maintained = gly1.hmmalign([seq.digitize() for seq in new])
+    assert maintained._members is not None
+    assert updated.members == maintained.members
+    assert set(updated.members) == {seq.name for seq in updated.msa.sequences}
+
+
+@pytest.fixture
+def thresholds_profiles(tmp_path):
+    profiles = [search.load_weighted_hmm(name,os.path.join(DATAS,msa),0.2,str(tmp_path))
+                for name, msa in [("Glyx3","GlyX3.msa.fa"),("Gly1","Gly1.msa.fa"),("Gly2","Gly2.msa.fa"),("Gly3","Gly3.msa.fa")]]
+    reference = str(tmp_path / "reference.fa")
+    profiles[0].dump(reference)
+    return reference, profiles
+
+
+def test_auto_thresholds_recalibrates_missing_families_only(thresholds_profiles,tmp_path,monkeypatch):
+    reference, profiles = thresholds_profiles
+    expected = search.auto_thresholds(reference,*profiles,10000,10000)
+    cache_file = str(tmp_path / "thresholds.yaml")
+    assert search.auto_thresholds(reference,*profiles,10000,10000,cache_file) == expected
+    keys = search.thresholds_keys(reference,*profiles,10000,10000)
+    searches = []
+    search_calcyanin = search.search_calcyanin
+    monkeypatch.setattr(search,"search_calcyanin",lambda *args,**kwargs: searches.append(args) or search_calcyanin(*args,**kwargs))
+    for missing, glyzip_searched in ((keys[0],False),(keys[1],True)):
+        with open(cache_file) as fh:
+            calibrated = yaml.safe_load(fh)
+        kept = {key:value for key, value in calibrated.items() if key != missing}
+        with open(cache_file,"w") as fh:
+            yaml.safe_dump(kept,fh)
+        searches.clear()
+        assert search.auto_thresholds(reference,*profiles,10000,10000,cache_file) == expected
+        assert bool(searches) == glyzip_searched
+        with open(cache_file) as fh:
+            calibrated = yaml.safe_load(fh)
+        assert calibrated == dict(kept,**{missing:calibrated[missing]})
+
+
+def test_thresholds_cache_keeps_concurrent_writes_and_is_bounded(thresholds_profiles,tmp_path,monkeypatch):
+    reference, profiles = thresholds_profiles
+    cache_file = str(tmp_path / "thresholds.yaml")
+    entry = {"e-value":1e-3,"coverage":0.5}
+    with open(cache_file,"w") as fh:
+        yaml.safe_dump({"old{}".format(i):entry for i in range(5)},fh,sort_keys=False)
+    search_calcyanin = search.search_calcyanin
+    def concurrent_search_calcyanin(*args,**kwargs):
+        # another run writes its own family while the reference is searched.
+        search._write_thresholds(cache_file,{"concurrent":entry})
+        return search_calcyanin(*args,**kwargs)
+    monkeypatch.setattr(search,"search_calcyanin",concurrent_search_calcyanin)
+    monkeypatch.setattr(search,"THRESHOLDS_CACHE_SIZE",4)
+    search.auto_thresholds(reference,*profiles,10000,10000,cache_file)
+    with open(cache_file) as fh:
+        calibrated = yaml.safe_load(fh)
+    assert list(calibrated) == ["old4","concurrent",*search.thresholds_keys(reference,*profiles,10000,10000)]
+
+
+def reference_summary(features,sequences):
+    """Summary of a feature table built group by group, as dump_iteration() of the first \
+    releases did, rows of summarize_features()."""
+    rows = []
+    for (sequence, sequence_src), seq_features_df in features.groupby(["sequence_id","sequence_src"]):
+        cterom = ",".join(seq_features_df[seq_features_df.feature_id.isin(["Gly1","Gly2","Gly3"])].sort_values("feature_start").feature_id)
+        nter_type, nter_neighbor = None, None
+        if not seq_features_df[seq_features_df.feature_id == "N-ter"].empty:
+            nter_type, nter_neighbor = "".join(set(
+                seq_features_df[seq_features_df.feature_id == "N-ter"].feature_src)).split("||")
+        rows.append((sequence,sequence_src,search.decision_tree(nter_type,cterom),nter_type,nter_neighbor,
+                     cterom,str(sequences.get_seq_by_id(sequence).seq)))
+    return rows
+
+
+@pytest.mark.parametrize("thresholds",THRESHOLDS)
+def test_summarize_features_parity(searched,thresholds):
+    sequences = search.hits_2_features(copy.deepcopy(searched),*thresholds)
+    features = sequences.to_feature_table()
+    # sequences without N-ter and with a second src, glycine zippers only in the latter.
+    ids = features.index.unique()[::2]
+    no_nter = features[~(features.index.isin(ids) & (features.feature_id == "N-ter"))]
+    other_src = features[features.feature_id != "N-ter"].assign(sequence_src="other")
+    for table in (features,no_nter,pd.concat([other_src,features])):
+        expected = reference_summary(table,sequences)
+        assert expected
+        summary = search.summarize_features(table,sequences)
+        assert table_rows(summary) == expected
+        assert summary.columns.tolist() == ["sequence_src","flag","nter","nter_neighbor","cter","sequence"]
+
+
+def reference_decision_tree(nter,cter):
+    """decision_tree() of the first releases."""
+    if re.search("Gly1,Gly2,Gly3",cter):
+        if nter in ["CoBaHMA-type","Y-type","X-type","Z-type"]:
+            return "Calcyanin with known N-ter"
+        return "Calcyanin with new N-ter"
+    elif re.search("Gly1,Gly3",cter) and nter == "Y-type":
+        return "Calcyanin with known N-ter"
+    elif re.search("Gly(1|2|3)",cter):
+        if nter in ["CoBaHMA-type","Y-type","X-type","Z-type"]:
+            return "Atypical Gly region with known N-ter"
+        return "Atypical Gly region with new N-ter"
+    return "Ancestral gly containing protein"
+
+
+def test_decision_tree_batch_parity():
+    nters = [None,np.nan,"CoBaHMA-type","X-type","Y-type","Z-type","W-type"]
+    cters = ["","Gly1,Gly2,Gly3","Gly2,Gly1,Gly2,Gly3","Gly1,Gly3","Gly3,Gly1","Gly2","Gly3,Gly3"]
+    pairs = [(n,c) for n in nters for c in cters]
+    pairs = pairs + pairs[::-1] + pairs[::3]
+    nter = pd.Series([n for n,_ in pairs],index=["s{}".format(i) for i in range(len(pairs))],dtype=object)
+    cter = pd.Series([c for _,c in pairs],index=nter.index,dtype=object)
+    flags = search.decision_tree_batch(nter,cter)
+    assert flags.index.equals(nter.index)
+    expected = [reference_decision_tree(None if pd.isna(n) else n,c) for n,c in pairs]
+    assert flags.tolist() == expected
+    assert flags.tolist() == [search.decision_tree(None if pd.isna(n) else n,c) for n,c in pairs]
+    assert set(expected) == {"Calcyanin with known N-ter","Calcyanin with new N-ter","Atypical Gly region with known N-ter",
+                             "Atypical Gly region with new N-ter","Ancestral gly containing protein"}
+    empty = search.decision_tree_batch(pd.Series([],dtype=object),pd.Series([],dtype=object))
+    assert empty.empty